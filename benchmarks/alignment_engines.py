@@ -0,0 +1,114 @@
+import argparse
+import random
+from time import perf_counter
+import spacy
+from spacy.tokens import Doc
+from errant.alignment import Alignment
+
+# Benchmark the alignment engines on random sentence pairs of different
+# lengths and edit densities, and check that the exact engines agree.
+# Usage (from the repository root or with errant installed):
+# python -m benchmarks.alignment_engines [-sizes 5 10 20 40 400] [-edits 0.1 0.5]
+
+# Words to draw the tokens from: (text, lemma, pos)
+WORDS = [("the", "the", "DET"), ("a", "a", "DET"), ("cat", "cat", "NOUN"),
+    ("cats", "cat", "NOUN"), ("dog", "dog", "NOUN"), ("dogs", "dog", "NOUN"),
+    ("house", "house", "NOUN"), ("run", "run", "VERB"), ("runs", "run", "VERB"),
+    ("ran", "run", "VERB"), ("is", "be", "AUX"), ("are", "be", "AUX"),
+    ("was", "be", "AUX"), ("big", "big", "ADJ"), ("bigger", "big", "ADJ"),
+    ("quickly", "quickly", "ADV"), ("in", "in", "ADP"), ("on", "on", "ADP"),
+    ("to", "to", "PART"), ("and", "and", "CCONJ"), ("he", "he", "PRON"),
+    ("she", "she", "PRON"), (".", ".", "PUNCT"), (",", ",", "PUNCT")]
+
+def main():
+    # Parse command line args
+    args = parse_args()
+    rng = random.Random(args.seed)
+    vocab = spacy.blank("en").vocab
+    print("Tokens\tEdits\t" + "\t".join(args.engines))
+    for size in args.sizes:
+        for density in args.edits:
+            pairs = []
+            for _ in range(max(1, args.tokens//size)):
+                orig = random_words(rng, size)
+                cor = random_edit(rng, orig, density)
+                pairs.append((make_doc(vocab, orig), make_doc(vocab, cor)))
+            times = []
+            seqs = {}
+            for engine in args.engines:
+                start = perf_counter()
+                seqs[engine] = [Alignment(orig, cor, False, engine).align_seq
+                    for orig, cor in pairs]
+                times.append(perf_counter()-start)
+            # The exact engines must find the same alignments
+            exact = [seqs[engine] for engine in seqs if engine != "document"]
+            assert all(seq == exact[0] for seq in exact), \
+                "The engines give different alignments."
+            print(f"{size}\t{density}\t" + "\t".join(f"{seconds:.3f}s"
+                for seconds in times))
+
+# Input 1: A random number generator
+# Input 2: The number of words
+# Output: A list of random (text, lemma, pos) words
+def random_words(rng, size):
+    return [rng.choice(WORDS) for _ in range(size)]
+
+# Input 1: A random number generator
+# Input 2: A list of (text, lemma, pos) words
+# Input 3: The number of edits per word
+# Output: A copy of the words with random deletions, insertions,
+# substitutions and swaps of neighbours
+def random_edit(rng, words, density):
+    words = list(words)
+    for _ in range(round(len(words)*density)):
+        n = rng.randrange(len(words)+1)
+        op = rng.choice("DIST")
+        if op == "I" or n >= len(words)-1: words.insert(n, rng.choice(WORDS))
+        elif op == "D": del words[n]
+        elif op == "S": words[n] = rng.choice(WORDS)
+        else: words[n], words[n+1] = words[n+1], words[n]
+    return words
+
+# Input 1: A spacy Vocab
+# Input 2: A list of (text, lemma, pos) words
+# Output: A Doc of the words
+def make_doc(vocab, words):
+    return Doc(vocab, words=[word[0] for word in words],
+        lemmas=[word[1] for word in words], pos=[word[2] for word in words])
+
+# Parse command line args
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the alignment engines on random sentence pairs.")
+    parser.add_argument(
+        "-sizes",
+        help="The numbers of orig tokens per pair (default: 5 10 20 40 400).",
+        type=int,
+        nargs="+",
+        default=[5, 10, 20, 40, 400])
+    parser.add_argument(
+        "-edits",
+        help="The numbers of edits per token (default: 0.1 0.5).",
+        type=float,
+        nargs="+",
+        default=[0.1, 0.5])
+    parser.add_argument(
+        "-engines",
+        help="The engines to time (default: python numpy banded document).",
+        nargs="+",
+        default=["python", "numpy", "banded", "document"])
+    parser.add_argument(
+        "-tokens",
+        help="The number of orig tokens to align per size (default: 4000).",
+        type=int,
+        default=4000)
+    parser.add_argument(
+        "-seed",
+        help="The random seed (default: 0).",
+        type=int,
+        default=0)
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+# Benchmark the time to import ERRANT modules in a new interpreter, and the
+# time to load the classifier resources on first use.
+# Usage (from the repository root or with errant installed):
+# python -m benchmarks.import_time [-modules errant errant.en.classifier]
+
+# The root of the repository, which is on the path of the new interpreters
+root = Path(__file__).resolve().parent.parent
+
+# Time an import, and then the first use of the word list if the classifier
+# was imported
+TIME_CODE = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+seconds = perf_counter()-start
+classifier = sys.modules.get("errant.en.classifier")
+resources = None
+if classifier is not None:
+    start = perf_counter()
+    classifier.spell
+    resources = perf_counter()-start
+print(json.dumps([seconds, resources]))
+"""
+
+def main():
+    # Parse command line args
+    args = parse_args()
+    print("Module\tImport\tResources")
+    for module in args.modules:
+        times = [run(TIME_CODE.format(module=module))
+            for _ in range(args.repeats)]
+        # Take the fastest run to reduce noise
+        seconds = min(time[0] for time in times)
+        resources = "-"
+        if times[0][1] is not None:
+            resources = f"{min(time[1] for time in times)*1000:.1f}ms"
+        print(f"{module}\t{seconds*1000:.1f}ms\t{resources}")
+
+# Input: Python code that prints a JSON result
+# Output: The result of running the code in a new interpreter
+def run(code):
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+        capture_output=True, text=True, cwd=root).stdout
+    return json.loads(output)
+
+# Parse command line args
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import time of ERRANT modules.")
+    parser.add_argument(
+        "-modules",
+        help="The modules to import (default: errant "
+            "errant.commands.compare_m2 errant.en.classifier).",
+        nargs="+",
+        default=["errant", "errant.commands.compare_m2", "errant.en.classifier"])
+    parser.add_argument(
+        "-repeats",
+        help="The number of times to import each module (default: 5).",
+        type=int,
+        default=5)
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import random
+from re import sub
+from time import perf_counter
+import spacy
+import spacy.symbols as POS
+from spacy.tokens import Doc
+from errant.alignment import Alignment
+from errant.en import merger
+from errant.en.merger import char_cost, is_punct, merge_edits, open_pos, poss_tag
+
+# Benchmark the rule merger on long runs of non-matches, e.g. rewritten
+# sentences, and check that the edits are the same as without memoization.
+# Usage (from the repository root or with errant installed):
+# python -m benchmarks.merge_runs [-sizes 20 40 80] [-seed 0]
+
+# POS and PTB tags to draw the tokens from
+TAGS = [("NOUN", "NN"), ("NOUN", "NNS"), ("VERB", "VB"), ("VERB", "VBD"),
+    ("AUX", "MD"), ("ADJ", "JJ"), ("ADV", "RB"), ("ADP", "IN"), ("DET", "DT"),
+    ("PRON", "PRP"), ("PART", "TO"), ("CCONJ", "CC")]
+
+def main():
+    # Parse command line args
+    args = parse_args()
+    rng = random.Random(args.seed)
+    vocab = spacy.blank("en").vocab
+    print("Tokens\tOps\tMemoized\tOriginal\tEdits")
+    for size in args.sizes:
+        # All substitutions: two unrelated sentences of the same length
+        orig = random_doc(vocab, rng, size)
+        cor = random_doc(vocab, rng, size)
+        alignment = Alignment(orig, cor, lev=True)
+        assert {op[0] for op in alignment.align_seq} == {"S"}
+        run(alignment, "S")
+        # Substitutions and insertions: the cor sentence is a quarter longer
+        cor = random_doc(vocab, rng, size+size//4)
+        alignment = Alignment(orig, cor, lev=True)
+        assert {op[0] for op in alignment.align_seq} == {"I", "S"}
+        run(alignment, "S+I")
+
+# Input 1: An Alignment object of a single run of non-matches
+# Input 2: A description of the ops in the run
+# Merges the run with the memoized merger and the original merger, checks
+# that they agree and prints their times
+def run(alignment, ops):
+    seq = alignment.align_seq
+    start = perf_counter()
+    merged = merger.process_seq(seq, alignment)
+    memo_time = perf_counter()-start
+    start = perf_counter()
+    reference = reference_process_seq(seq, alignment)
+    reference_time = perf_counter()-start
+    assert merged == reference, "The memoized merger gives different edits."
+    print(f"{len(alignment.orig)}\t{ops}\t{memo_time:.3f}s\t\t"
+        f"{reference_time:.3f}s\t\t{len(merged)}")
+
+# Input 1: A spacy Vocab
+# Input 2: A random number generator
+# Input 3: The number of tokens
+# Output: A Doc of new random words with random tags
+def random_doc(vocab, rng, size):
+    words = []
+    pos = []
+    tags = []
+    while len(words) < size:
+        word = "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(6))
+        # Every word is new, so the runs contain no matches
+        if word in vocab.strings: continue
+        vocab.strings.add(word)
+        words.append(word)
+        tag = rng.choice(TAGS)
+        pos.append(tag[0])
+        tags.append(tag[1])
+    return Doc(vocab, words=words, pos=pos, tags=tags)
+
+# The original merger, which recurses on slices of the run and recomputes
+# every subsequence
+# Input 1: A sequence of adjacent D, I and/or S alignments
+# Input 2: An Alignment object
+# Output: A sequence of merged/split alignments
+def reference_process_seq(seq, alignment):
+    if len(seq) <= 1: return seq
+    ops = [op[0] for op in seq]
+    if set(ops) == {"D"} or set(ops) == {"I"}: return merge_edits(seq)
+    content = False
+    combos = [(start, end) for start in range(len(seq))
+        for end in range(start+1, len(seq))]
+    combos.sort(key = lambda x: x[1]-x[0], reverse=True)
+    o_feats = alignment.o_feats
+    c_feats = alignment.c_feats
+    for start, end in combos:
+        if "S" not in ops[start:end+1]: continue
+        o_start, o_end = seq[start][1], seq[end][2]
+        c_start, c_end = seq[start][3], seq[end][4]
+        o_len = o_end-o_start
+        c_len = c_end-c_start
+        if start == 0 and (o_feats.tag[o_start] == poss_tag or \
+                c_feats.tag[c_start] == poss_tag):
+            return [seq[0]] + reference_process_seq(seq[1:], alignment)
+        if o_feats.tag[o_end-1] == poss_tag or c_feats.tag[c_end-1] == poss_tag:
+            return reference_process_seq(seq[:end-1], alignment) + \
+                merge_edits(seq[end-1:end+1]) + \
+                reference_process_seq(seq[end+1:], alignment)
+        if o_feats.lower[o_end-1] == c_feats.lower[c_end-1]:
+            if start == 0 and \
+                    ((o_len == 1 and c_feats.text[c_start][0].isupper()) or \
+                    (c_len == 1 and o_feats.text[o_start][0].isupper())):
+                return merge_edits(seq[start:end+1]) + \
+                    reference_process_seq(seq[end+1:], alignment)
+            if (o_len > 1 and is_punct(o_feats, o_end-2)) or \
+                    (c_len > 1 and is_punct(c_feats, c_end-2)):
+                return reference_process_seq(seq[:end-1], alignment) + \
+                    merge_edits(seq[end-1:end+1]) + \
+                    reference_process_seq(seq[end+1:], alignment)
+        s_str = sub("['-]", "", "".join(o_feats.lower_[o_start:o_end]))
+        t_str = sub("['-]", "", "".join(c_feats.lower_[c_start:c_end]))
+        if s_str == t_str:
+            return reference_process_seq(seq[:start], alignment) + \
+                merge_edits(seq[start:end+1]) + \
+                reference_process_seq(seq[end+1:], alignment)
+        pos_set = set(o_feats.pos[o_start:o_end]+c_feats.pos[c_start:c_end])
+        if o_len != c_len and (len(pos_set) == 1 or \
+                pos_set.issubset({POS.AUX, POS.PART, POS.VERB})):
+            return reference_process_seq(seq[:start], alignment) + \
+                merge_edits(seq[start:end+1]) + \
+                reference_process_seq(seq[end+1:], alignment)
+        if end-start < 2:
+            if o_len == c_len == 2:
+                return reference_process_seq(seq[:start+1], alignment) + \
+                    reference_process_seq(seq[start+1:], alignment)
+            if (ops[start] == "S" and char_cost(o_feats.text[o_start],
+                    c_feats.text[c_start]) > 0.75) or \
+                    (ops[end] == "S" and char_cost(o_feats.text[o_end-1],
+                    c_feats.text[c_end-1]) > 0.75):
+                return reference_process_seq(seq[:start+1], alignment) + \
+                    reference_process_seq(seq[start+1:], alignment)
+            if end == len(seq)-1 and ((ops[-1] in {"D", "S"} and \
+                    o_feats.pos[o_end-1] == POS.DET) or (ops[-1] in {"I", "S"} and \
+                    c_feats.pos[c_end-1] == POS.DET)):
+                return reference_process_seq(seq[:-1], alignment) + [seq[-1]]
+        if not pos_set.isdisjoint(open_pos): content = True
+    if content: return merge_edits(seq)
+    else: return seq
+
+# Parse command line args
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the rule merger on long runs of non-matches.")
+    parser.add_argument(
+        "-sizes",
+        help="The numbers of orig tokens in each run (default: 20 40 80).",
+        type=int,
+        nargs="+",
+        default=[20, 40, 80])
+    parser.add_argument(
+        "-seed",
+        help="The random seed (default: 0).",
+        type=int,
+        default=0)
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    main()
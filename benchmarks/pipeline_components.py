@@ -0,0 +1,95 @@
+import argparse
+from itertools import cycle, islice
+from time import perf_counter
+import spacy
+from errant import get_unused_components
+
+# Benchmark the spacy throughput of the full pipeline of a model against the
+# pipeline without the components that errant.load removes.
+# Usage (from the repository root or with errant installed):
+# python -m benchmarks.pipeline_components [-model en_core_web_sm] [-input FILE]
+
+# Sentences to parse if no input file is given
+SENTENCES = [
+    "This are a sentence with a error in it .",
+    "I have went to the shop yesterday and buyed some apples .",
+    "She don't like the informations that was given to her by John .",
+    "When we arrived , the train had already leave the station .",
+    "The children plays in the park every day after the school .",
+    "He is more taller than his brother , but less stronger .",
+    "London is a city where many people from the world comes to live .",
+    "Could you please send me more details about the course in Paris ?",
+]
+
+def main():
+    # Parse command line args
+    args = parse_args()
+    nlp = spacy.load(args.model)
+    unused = get_unused_components(nlp)
+    # Get the texts to parse
+    if args.input:
+        with open(args.input) as input_file:
+            texts = [line.strip() for line in input_file if line.strip()]
+    else: texts = SENTENCES
+    texts = list(islice(cycle(texts), args.n))
+    print(f"Pipeline: {', '.join(nlp.pipe_names)}")
+    print(f"Removed by errant.load: {', '.join(unused) or 'none'}")
+    # Time the full pipeline, the pipeline without ner as in ERRANT 3.0.2, and
+    # the pipeline without the unused components
+    runs = [("All components", [])]
+    if "ner" in nlp.pipe_names: runs.append(("Without ner", ["ner"]))
+    runs.append(("Without unused components", unused))
+    base = None
+    for name, disabled in runs:
+        seconds = time_pipe(nlp, texts, disabled, args.batch_size, args.repeats)
+        base = base or seconds
+        print(f"{name}: {len(texts)/seconds:.0f} sentences/s "
+            f"({base/seconds:.2f}x)")
+
+# Input 1: A spacy processing object
+# Input 2: A list of text strings
+# Input 3: The names of the components to disable
+# Input 4: The number of texts to buffer in spacy
+# Input 5: The number of times to parse the texts
+# Output: The fastest time to parse the texts, in seconds
+def time_pipe(nlp, texts, disabled, batch_size, repeats):
+    best = float("inf")
+    with nlp.select_pipes(disable=disabled):
+        for _ in range(repeats):
+            start = perf_counter()
+            for doc in nlp.pipe(texts, batch_size=batch_size): pass
+            best = min(best, perf_counter()-start)
+    return best
+
+# Parse command line args
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark spacy with and without the components that "
+            "ERRANT does not need.")
+    parser.add_argument(
+        "-model",
+        help="The spacy model name or path (default: en_core_web_sm).",
+        default="en_core_web_sm")
+    parser.add_argument(
+        "-input",
+        help="A file with one sentence per line (default: built-in sentences).")
+    parser.add_argument(
+        "-n",
+        help="The number of sentences to parse (default: 5000).",
+        type=int,
+        default=5000)
+    parser.add_argument(
+        "-batch_size",
+        help="The number of sentences to buffer in spacy (default: 1000).",
+        type=int,
+        default=1000)
+    parser.add_argument(
+        "-repeats",
+        help="The number of times to parse the sentences (default: 3).",
+        type=int,
+        default=3)
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    main()
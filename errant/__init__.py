@@ -1,10 +1,14 @@
 from importlib import import_module
-import spacy
-from errant.annotator import Annotator
+import warnings
 
 # ERRANT version
 __version__ = '3.0.2'
 
+# The token attributes that ERRANT reads, as assigned by spacy components
+token_attrs = {"token.tag", "token.pos", "token.lemma", "token.dep", "token.head"}
+# The same attributes as spacy annotation names
+doc_annotations = ["TAG", "POS", "LEMMA", "DEP"]
+
 # Load an ERRANT Annotator object for a given language
 def load(lang, nlp=None):
     # Make sure the language is supported
@@ -12,8 +16,23 @@ def load(lang, nlp=None):
     if lang not in supported:
         raise Exception(f"{lang} is an unsupported or unknown language")
 
-    # Load spacy (small model if no model supplied)
-    nlp = nlp or spacy.load(f"{lang}_core_web_sm", disable=["ner"])
+    # Spacy is only imported when it is needed, so importing errant is fast
+    import spacy
+    from errant.annotator import Annotator
+
+    # Load spacy (small model if no model supplied) with only the components
+    # that ERRANT needs
+    if nlp is None:
+        nlp = spacy.load(f"{lang}_core_web_sm")
+        for name in get_unused_components(nlp):
+            nlp.remove_pipe(name)
+    # Warn if a supplied model does not provide the annotations ERRANT needs
+    else:
+        missing = get_missing_annotations(nlp)
+        if missing:
+            warnings.warn("The spacy pipeline does not set the token "
+                f"annotations {missing}, which ERRANT needs to merge and "
+                "classify edits.")
 
     # Load language edit merger
     merger = import_module(f"errant.{lang}.merger")
@@ -24,4 +43,36 @@ def load(lang, nlp=None):
     if lang == "en": classifier.nlp = nlp
 
     # Return a configured ERRANT annotator
-    return Annotator(lang, nlp, merger, classifier)
\ No newline at end of file
+    return Annotator(lang, nlp, merger, classifier)
+
+# Input: A module attribute name
+# Output: The Annotator class, which is only imported (with spacy) on first use
+def __getattr__(name):
+    if name == "Annotator":
+        from errant.annotator import Annotator
+        return Annotator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Input: A spacy processing object
+# Output: The names of the enabled components that ERRANT does not need
+# A component is needed if it assigns an attribute that ERRANT or a later
+# needed component reads, if it does not declare what it assigns (e.g. the
+# attribute_ruler that maps tags to POS), or if a needed component listens
+# to it (e.g. a shared tok2vec).
+def get_unused_components(nlp):
+    needed_attrs = set(token_attrs)
+    needed = set()
+    for name in reversed(nlp.pipe_names):
+        meta = nlp.get_pipe_meta(name)
+        assigns = set(meta.assigns)
+        listeners = set(getattr(nlp.get_pipe(name), "listening_components", []))
+        if not assigns or assigns & needed_attrs or listeners & needed:
+            needed.add(name)
+            needed_attrs |= set(meta.requires)
+    return [name for name in nlp.pipe_names if name not in needed]
+
+# Input: A spacy processing object
+# Output: A list of the annotations in doc_annotations that nlp does not set
+def get_missing_annotations(nlp):
+    doc = nlp("This is a short sentence.")
+    return [attr for attr in doc_annotations if not doc.has_annotation(attr)]
@@ -1,113 +1,665 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
 from itertools import groupby
-from rapidfuzz.distance import Indel
+from time import perf_counter
+from rapidfuzz import process
+from rapidfuzz.distance import Indel, Levenshtein
 import spacy.parts_of_speech as POS
 from errant.edit import Edit
+from errant.features import get_features
+
+# Raised when an alignment takes longer than its time limit
+class AlignmentTimeout(Exception):
+    pass
 
 class Alignment:
-    # Protected class resource
+    # Protected class resources
     _open_pos = {POS.ADJ, POS.ADV, POS.NOUN, POS.VERB}
+    # Op names of the op codes stored in the op matrices; code 0 is a
+    # transposition whose size is stored in the trans matrix
+    _op_names = ["T", "S", "I", "D", "M", "O"]
+    # The numpy engine only pays off from about 60x60 cells
+    _numpy_min_cells = 3600
+    # The banded engine fills the full matrices instead of a band that holds
+    # more than 1/_band_max_fraction of their cells
+    _band_max_fraction = 8
 
     # Input 1: An original text string parsed by spacy
     # Input 2: A corrected text string parsed by spacy
     # Input 3: A flag for standard Levenshtein alignment
-    def __init__(self, orig, cor, lev=False):
+    # Input 4: The alignment engine; "python", "numpy" (vectorized),
+    # "banded" (only fill cells near the diagonal), "document" (only align
+    # the gaps between anchor tokens; approximate) or "editops" (standard
+    # Levenshtein alignment in C; always sets lev)
+    # Input 5: A flag to keep the matrices after the backtrace
+    # Input 6: A function like get_feature_sub_cost, e.g. a cached one
+    # Input 7: A perf_counter time by which the alignment must be finished
+    def __init__(self, orig, cor, lev=False, engine="python",
+            keep_matrices=True, sub_cost=None, deadline=None):
         # Set orig and cor
         self.orig = orig
         self.cor = cor
-        # Align orig and cor and get the cost and op matrices
-        self.cost_matrix, self.op_matrix = self.align(lev)
-        # Get the cheapest align sequence from the op matrix
-        self.align_seq = self.get_cheapest_align_seq()
-
-    # Input: A flag for standard Levenshtein alignment
-    # Output: The cost matrix and the operation matrix of the alignment
-    def align(self, lev):
+        # The token features of orig and cor; the engines only read these
+        self.o_feats = get_features(orig)
+        self.c_feats = get_features(cor)
+        self.lev = lev
+        self.keep_matrices = keep_matrices
+        self.sub_cost = sub_cost or get_feature_sub_cost
+        self.deadline = deadline
+        # The full cost, op and trans matrices; only computed up front if they
+        # are the same as the aligned matrices
+        self._full_matrices = None
+        # The band of the aligned matrices: row i holds the cells
+        # j = i+band...; None if the rows hold every cell
+        self._band = None
+        # The common prefix and suffix can only ever be matches, so only
+        # align the tokens in between. See get_affix_op for why this is exact.
+        self.prefix, self.suffix = self.get_common_affixes()
+        o_mid = self.o_feats[self.prefix:len(orig)-self.suffix]
+        c_mid = self.c_feats[self.prefix:len(cor)-self.suffix]
+        # Make sure the engine is supported
+        if engine not in {"python", "numpy", "banded", "document", "editops"}:
+            raise Exception("Unknown alignment engine. Choose from: "
+                "python, numpy, banded, document, editops.")
+        # Document alignment: align the gaps between anchors separately
+        if engine == "document" and not lev:
+            self.align_seq = self.get_document_align_seq(o_mid, c_mid)
+        # Levenshtein alignment from the rapidfuzz editops
+        elif engine == "editops":
+            self.lev = True
+            self.align_seq = self.get_editops_align_seq(o_mid, c_mid)
+        # Align orig and cor and get the cost, op and trans matrices
+        else:
+            if lev:
+                self._band, matrices = self.align_lev(o_mid, c_mid)
+            elif engine == "python":
+                matrices = self.align(lev, o_mid, c_mid)
+            elif engine == "numpy":
+                matrices = self.align_numpy(lev, o_mid, c_mid)
+            else:
+                self._band, matrices = self.align_banded(lev, o_mid, c_mid)
+            # Keep the op and trans matrices and the length of their rows
+            _, self._ops, self._trans = matrices
+            self._row_len = len(self._ops)//(len(o_mid)+1)
+            if keep_matrices and self._band is None and \
+                    self.prefix == self.suffix == 0:
+                self._full_matrices = matrices
+            # The backtrace only needs the op and trans matrices
+            del matrices
+            # Get the cheapest align sequence from the op matrix
+            self.align_seq = self.get_cheapest_align_seq()
+            # Free the matrices; the full matrices can still be recomputed
+            if not keep_matrices: self._ops = self._trans = None
+        # The deadline does not apply to recomputing the full matrices
+        self.deadline = None
+
+    # The cost matrix of the alignment as a list of rows
+    @property
+    def cost_matrix(self):
+        costs, ops, trans = self.get_full_matrices()
+        row_len = len(self.cor)+1
+        return [costs[r:r+row_len].tolist()
+            for r in range(0, len(costs), row_len)]
+
+    # The operation matrix of the alignment as a list of rows
+    @property
+    def op_matrix(self):
+        costs, ops, trans = self.get_full_matrices()
+        row_len = len(self.cor)+1
+        names = [self._op_names[op] if op else "T"+str(k)
+            for op, k in zip(ops, trans)]
+        return [names[r:r+row_len] for r in range(0, len(names), row_len)]
+
+    # Output: The cost, op and trans matrices of the full alignment
+    # They are only computed here if the engine skipped any cells, and are
+    # recomputed on every call if the matrices are not kept.
+    def get_full_matrices(self):
+        if self._full_matrices is not None: return self._full_matrices
+        matrices = self.align(self.lev)
+        if self.keep_matrices: self._full_matrices = matrices
+        return matrices
+
+    # Input 1: A flag for standard Levenshtein alignment
+    # Input 2: The Features of the orig tokens to align (default: all)
+    # Input 3: The Features of the cor tokens to align (default: all)
+    # Output 1: The cost matrix of the alignment
+    # Output 2: The op matrix of the alignment; codes index _op_names
+    # Output 3: The trans matrix; the size of the transposition in each T cell
+    # All the matrices are flat typed arrays where cell [i][j] is at
+    # i*(len(cor)+1)+j.
+    def align(self, lev, orig=None, cor=None):
+        orig = self.o_feats if orig is None else orig
+        cor = self.c_feats if cor is None else cor
         # Sentence lengths
-        o_len = len(self.orig)
-        c_len = len(self.cor)
-        # Lower case token IDs (for transpositions)
-        o_low = [o.lower for o in self.orig]
-        c_low = [c.lower for c in self.cor]
-        # Create the cost_matrix and the op_matrix
-        cost_matrix = [[0.0 for j in range(c_len+1)] for i in range(o_len+1)]
-        op_matrix = [["O" for j in range(c_len+1)] for i in range(o_len+1)]
+        o_len = len(orig)
+        c_len = len(cor)
+        # Token IDs (for matches) and lower case token IDs (for transpositions)
+        o_orth = orig.orth
+        c_orth = cor.orth
+        o_low = orig.lower
+        c_low = cor.lower
+        # Substitution cost keys
+        o_sub = orig.sub_key
+        c_sub = cor.sub_key
+        # Create the cost_matrix, the op_matrix and the trans_matrix
+        row_len = c_len+1
+        size = (o_len+1)*row_len
+        cost_matrix = array("d", [0.0])*size
+        op_matrix = array("B", [5])*size
+        trans_matrix = self.get_trans_array(o_len, c_len, size)
         # Fill in the edges
         for i in range(1, o_len+1):
-            cost_matrix[i][0] = cost_matrix[i-1][0] + 1
-            op_matrix[i][0] = "D"
+            cost_matrix[i*row_len] = i
+            op_matrix[i*row_len] = 3
         for j in range(1, c_len+1):
-            cost_matrix[0][j] = cost_matrix[0][j-1] + 1
-            op_matrix[0][j] = "I"
+            cost_matrix[j] = j
+            op_matrix[j] = 2
 
         # Loop through the cost_matrix
         for i in range(o_len):
+            self.check_deadline()
             for j in range(c_len):
+                # The flat index of cell [i+1][j+1]
+                cell = (i+1)*row_len+j+1
                 # Matches
-                if self.orig[i].orth == self.cor[j].orth:
-                    cost_matrix[i+1][j+1] = cost_matrix[i][j]
-                    op_matrix[i+1][j+1] = "M"
+                if o_orth[i] == c_orth[j]:
+                    cost_matrix[cell] = cost_matrix[cell-row_len-1]
+                    op_matrix[cell] = 4
                 # Non-matches
                 else:
-                    del_cost = cost_matrix[i][j+1] + 1
-                    ins_cost = cost_matrix[i+1][j] + 1
+                    del_cost = cost_matrix[cell-row_len] + 1
+                    ins_cost = cost_matrix[cell-1] + 1
                     trans_cost = float("inf")
                     # Standard Levenshtein (S = 1)
-                    if lev: sub_cost = cost_matrix[i][j] + 1
+                    if lev: sub_cost = cost_matrix[cell-row_len-1] + 1
                     # Linguistic Damerau-Levenshtein
                     else:
                         # Custom substitution
-                        sub_cost = cost_matrix[i][j] + \
-                            self.get_sub_cost(self.orig[i], self.cor[j])
+                        sub_cost = cost_matrix[cell-row_len-1] + \
+                            self.get_sub_cost(o_sub[i], c_sub[j])
                         # Transpositions require >=2 tokens
                         # Traverse the diagonal while there is not a Match.
+                        # The sums of the token IDs are equal if the tokens
+                        # are a permutation of each other, so only sort the
+                        # tokens when the sums are equal.
                         k = 1
+                        diag = cell-row_len-1
+                        o_sum = o_low[i]
+                        c_sum = c_low[j]
                         while i-k >= 0 and j-k >= 0 and \
-                                cost_matrix[i-k+1][j-k+1] != cost_matrix[i-k][j-k]:
-                            if sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
-                                trans_cost = cost_matrix[i-k][j-k] + k
+                                cost_matrix[diag] != cost_matrix[diag-row_len-1]:
+                            o_sum += o_low[i-k]
+                            c_sum += c_low[j-k]
+                            if o_sum == c_sum and \
+                                    sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                                trans_cost = cost_matrix[diag-row_len-1] + k
                                 break
                             k += 1
+                            diag -= row_len+1
                     # Costs
                     costs = [trans_cost, sub_cost, ins_cost, del_cost]
                     # Get the index of the cheapest (first cheapest if tied)
                     l = costs.index(min(costs))
                     # Save the cost and the op in the matrices
-                    cost_matrix[i+1][j+1] = costs[l]
-                    if   l == 0: op_matrix[i+1][j+1] = "T"+str(k+1)
-                    elif l == 1: op_matrix[i+1][j+1] = "S"
-                    elif l == 2: op_matrix[i+1][j+1] = "I"
-                    else: op_matrix[i+1][j+1] = "D"
+                    cost_matrix[cell] = costs[l]
+                    op_matrix[cell] = l
+                    if l == 0: trans_matrix[cell] = k+1
         # Return the matrices
-        return cost_matrix, op_matrix
+        return cost_matrix, op_matrix, trans_matrix
+
+    # Input 1: A flag for standard Levenshtein alignment
+    # Input 2: The Features of the orig tokens to align
+    # Input 3: The Features of the cor tokens to align
+    # Output: The cost, op and trans matrices of the alignment (see align)
+    # Vectorized version of align: the substitution costs are precomputed as a
+    # matrix and each anti-diagonal of the matrices is filled at once. The
+    # results (including tie-breaking) are identical to align. Small matrices
+    # are filled by align, which is faster when the anti-diagonals are short.
+    def align_numpy(self, lev, orig, cor):
+        import numpy as np
+        # Sentence lengths
+        o_len = len(orig)
+        c_len = len(cor)
+        if o_len*c_len < self._numpy_min_cells: return self.align(lev, orig, cor)
+        # Lower case token IDs (for transpositions)
+        o_low = orig.lower
+        c_low = cor.lower
+        # Token matches and substitution costs between every orig and cor token
+        matches = np.array(orig.orth, dtype=np.uint64)[:, None] == \
+            np.array(cor.orth, dtype=np.uint64)[None, :]
+        if lev: sub_costs = np.ones((o_len, c_len))
+        else: sub_costs = self.get_sub_cost_matrix(orig, cor)
+        # Only the cells that end a permutation are traversed for transpositions
+        if not lev: trans_ok = self.get_trans_candidates(o_low, c_low)
+        # Create the cost matrix, the op matrix and the trans matrix
+        cost_matrix = np.zeros((o_len+1, c_len+1))
+        op_matrix = np.full((o_len+1, c_len+1), 5, dtype=np.uint8)
+        trans_matrix = np.zeros((o_len+1, c_len+1), dtype=np.int64)
+        # Fill in the edges
+        cost_matrix[1:, 0] = np.arange(1, o_len+1)
+        op_matrix[1:, 0] = 3
+        cost_matrix[0, 1:] = np.arange(1, c_len+1)
+        op_matrix[0, 1:] = 2
 
-    # Input 1: A spacy orig Token
-    # Input 2: A spacy cor Token
+        # Loop through the anti-diagonals of the cost_matrix; every cell on an
+        # anti-diagonal only depends on cells on previous anti-diagonals.
+        for d in range(2, o_len+c_len+1):
+            self.check_deadline()
+            # Matrix coordinates of the cells on this anti-diagonal
+            rows = np.arange(max(1, d-c_len), min(o_len, d-1)+1)
+            cols = d - rows
+            diag_costs = cost_matrix[rows-1, cols-1]
+            # Costs: [trans_cost, sub_cost, ins_cost, del_cost]
+            costs = np.empty((4, len(rows)))
+            costs[0] = np.inf
+            costs[1] = diag_costs + sub_costs[rows-1, cols-1]
+            costs[2] = cost_matrix[rows, cols-1] + 1
+            costs[3] = cost_matrix[rows-1, cols] + 1
+            match = matches[rows-1, cols-1]
+            # Transpositions (Linguistic Damerau-Levenshtein only)
+            if not lev:
+                cands = ~match & trans_ok[rows-1, cols-1] & (rows > 1) & (cols > 1)
+                for n in np.flatnonzero(cands):
+                    trans_cost, k = self.get_trans_cost(cost_matrix,
+                        o_low, c_low, rows[n]-1, cols[n]-1)
+                    costs[0, n] = trans_cost
+                    trans_matrix[rows[n], cols[n]] = k+1
+            # Get the index of the cheapest (first cheapest if tied)
+            l = costs.argmin(axis=0)
+            # Save the cost and the op in the matrices
+            cost_matrix[rows, cols] = np.where(match, diag_costs,
+                costs[l, np.arange(len(rows))])
+            op_matrix[rows, cols] = np.where(match, 4, l)
+        # Only keep the trans sizes of the cells that are transpositions
+        trans_matrix[op_matrix != 0] = 0
+        # Convert the matrices to the same format as align
+        trans_array = self.get_trans_array(o_len, c_len, 0)
+        trans_array.frombytes(trans_matrix.astype(trans_array.typecode).tobytes())
+        return array("d", cost_matrix.tobytes()), \
+            array("B", op_matrix.tobytes()), trans_array
+
+    # Input 1: A flag for standard Levenshtein alignment
+    # Input 2: The Features of the orig tokens to align
+    # Input 3: The Features of the cor tokens to align
+    # Output 1: The band offset of the first cell in each row
+    # Output 2: The cost, op and trans matrices of the cells inside the band
+    # Only fills the cells whose diagonal is at most `width` away from the
+    # diagonals of the start and end cells. The width doubles until the band
+    # provably contains the same cheapest alignment as the full matrices, so
+    # the time scales with the sentence length times the edit distance.
+    # If the band gets too wide (see get_band_width), the full matrices are
+    # filled instead and the band offset is None.
+    def align_banded(self, lev, orig, cor):
+        o_len = len(orig)
+        c_len = len(cor)
+        width = self.get_band_width(orig, cor)
+        while width is not None:
+            lo, hi = self.get_band(o_len, c_len, width)
+            matrices = self.align_band(lev, orig, cor, lo, hi)
+            if matrices is not None: return lo, matrices
+            width *= 2
+            if not self.is_band_cheaper(o_len, c_len, width): break
+        return None, self.align(lev, orig, cor)
+
+    # Input 1: The Features of the orig tokens to align
+    # Input 2: The Features of the cor tokens to align
+    # Output: The width of the first band to try; None if the full matrices
+    # are cheaper
+    # The width is estimated from the Levenshtein distance. Checking the
+    # transpositions of a band costs more per cell than align, so a band that
+    # would hold more than a small fraction of the matrix, e.g. for dense
+    # edits, is not worth it.
+    def get_band_width(self, orig, cor):
+        o_len = len(orig)
+        c_len = len(cor)
+        width = max(2, (self.get_lev_distance(orig, cor)-abs(c_len-o_len))//2)
+        if self.is_band_cheaper(o_len, c_len, width): return width
+        return None
+
+    # Input 1: The number of orig tokens
+    # Input 2: The number of cor tokens
+    # Input 3: The width of a band
+    # Output: The lowest and highest diagonal (j-i) in the band
+    def get_band(self, o_len, c_len, width):
+        lo = max(min(0, c_len-o_len)-width, -o_len)
+        hi = min(max(0, c_len-o_len)+width, c_len)
+        return lo, hi
+
+    # Input 1: The number of orig tokens
+    # Input 2: The number of cor tokens
+    # Input 3: The width of a band
+    # Output: Whether the band holds at most 1/_band_max_fraction of the cells
+    def is_band_cheaper(self, o_len, c_len, width):
+        lo, hi = self.get_band(o_len, c_len, width)
+        return (hi-lo+1)*self._band_max_fraction <= c_len+1
+
+    # Input 1: The Features of the orig tokens to align
+    # Input 2: The Features of the cor tokens to align
+    # Output 1: The band offset of the first cell in each row
+    # Output 2: The cost, op and trans matrices of the cells inside the band
+    # Standard Levenshtein alignment. rapidfuzz computes the edit distance in C,
+    # and every cell on a path with that cost lies in a band whose width
+    # follows from it, so only that band is filled. Unlike the rapidfuzz
+    # editops, this keeps the usual tie-breaking between S, I and D.
+    def align_lev(self, orig, cor):
+        dist = self.get_lev_distance(orig, cor)
+        # Cells on diagonal (j-i) need at least |j-i|+|diff-(j-i)| indels
+        diff = len(cor)-len(orig)
+        width = (dist-abs(diff))//2
+        lo = max(min(0, diff)-width, -len(orig))
+        hi = min(max(0, diff)+width, len(cor))
+        return lo, self.align_band(True, orig, cor, lo, hi)
+
+    # Input 1: A flag for standard Levenshtein alignment
+    # Input 2: The Features of the orig tokens to align
+    # Input 3: The Features of the cor tokens to align
+    # Input 4: The lowest diagonal (j-i) in the band
+    # Input 5: The highest diagonal (j-i) in the band
+    # Output: The cost, op and trans matrices of the band (see align), where
+    # cell [i][j] is at i*(hi-lo+1)+j-i-lo; None if the band is too narrow
+    # Cells outside the band cost at least their number of insertions and
+    # deletions, so a path that leaves the band costs at least `limit`. Cells
+    # that cost less than `limit` minus the indels still needed to reach the end
+    # are certain: they have the same cost and op as in the full matrices.
+    # This holds by induction as long as the transposition walk of a cell that
+    # might be certain never depends on uncertain cells, which is checked below.
+    # The band is sufficient if the bottom right cell is certain.
+    def align_band(self, lev, orig, cor, lo, hi):
+        # Sentence lengths
+        o_len = len(orig)
+        c_len = len(cor)
+        diff = c_len-o_len
+        # Token IDs (for matches) and lower case token IDs (for transpositions)
+        o_orth = orig.orth
+        c_orth = cor.orth
+        o_low = orig.lower
+        c_low = cor.lower
+        # Substitution cost keys
+        o_sub = orig.sub_key
+        c_sub = cor.sub_key
+        # Lower bound on the cost of a path that leaves the band
+        limit = float("inf")
+        if lo > -o_len: limit = min(limit, abs(lo-1)+abs(lo-1-diff))
+        if hi < c_len: limit = min(limit, abs(hi+1)+abs(hi+1-diff))
+        # Row i of the band holds cells j = i+lo ... i+hi
+        width = hi-lo+1
+        size = (o_len+1)*width
+        cost_matrix = array("d", [float("inf")])*size
+        op_matrix = array("B", [5])*size
+        trans_matrix = self.get_trans_array(o_len, c_len, size)
+        # Cost of a band cell; inf outside the band
+        def cost(i, j):
+            if lo <= j-i <= hi: return cost_matrix[i*width+j-i-lo]
+            return float("inf")
+        # Fill in the edges
+        for i in range(0, min(o_len, -lo)+1):
+            cost_matrix[i*width-i-lo] = i
+            if i: op_matrix[i*width-i-lo] = 3
+        for j in range(1, hi+1):
+            cost_matrix[j-lo] = j
+            op_matrix[j-lo] = 2
+
+        # Loop through the band
+        for i in range(o_len):
+            self.check_deadline()
+            for j in range(max(0, i+lo), min(c_len-1, i+hi)+1):
+                # The flat index of cell [i+1][j+1]
+                cell = (i+1)*width+j-i-lo
+                # Cost below which a cell on this diagonal is certain
+                certain = limit-abs(diff-(j-i))
+                # Matches
+                if o_orth[i] == c_orth[j]:
+                    cost_matrix[cell] = cost(i, j)
+                    op_matrix[cell] = 4
+                    continue
+                # Non-matches
+                del_cost = cost(i, j+1) + 1
+                ins_cost = cost(i+1, j) + 1
+                trans_cost = float("inf")
+                # Standard Levenshtein (S = 1)
+                if lev: sub_cost = cost(i, j) + 1
+                # Linguistic Damerau-Levenshtein
+                else:
+                    # Custom substitution
+                    sub_cost = cost(i, j) + \
+                        self.get_sub_cost(o_sub[i], c_sub[j])
+                    # Transpositions: record the first step of the walk that
+                    # compares an uncertain cell.
+                    # Only sort the tokens if their ID sums are equal.
+                    k = 1
+                    unsure = 0
+                    o_sum = o_low[i]
+                    c_sum = c_low[j]
+                    while i-k >= 0 and j-k >= 0:
+                        if not unsure and max(cost(i-k+1, j-k+1),
+                                cost(i-k, j-k)) >= certain:
+                            unsure = k
+                        if cost(i-k+1, j-k+1) == cost(i-k, j-k): break
+                        o_sum += o_low[i-k]
+                        c_sum += c_low[j-k]
+                        if o_sum == c_sum and \
+                                sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                            trans_cost = cost(i-k, j-k) + k
+                            break
+                        k += 1
+                    trans_k = k
+                    # The full walk might stop or continue at any unsure step,
+                    # so fail if any transposition from there on could decide
+                    # the op of a certain cell or make this cell certain.
+                    best = min(sub_cost, ins_cost, del_cost)
+                    k = unsure
+                    o_sum = sum(o_low[i-k+1:i+1])
+                    c_sum = sum(c_low[j-k+1:j+1])
+                    while unsure and i-k >= 0 and j-k >= 0 and \
+                            k <= best and k < certain:
+                        start_cost = cost(i-k, j-k)
+                        o_sum += o_low[i-k]
+                        c_sum += c_low[j-k]
+                        if start_cost+k < certain and start_cost+k <= best and \
+                                o_sum == c_sum and \
+                                sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                            return None
+                        # Both cells are certain and equal: the walk stops
+                        if max(cost(i-k+1, j-k+1), start_cost) < certain and \
+                                cost(i-k+1, j-k+1) == start_cost:
+                            break
+                        k += 1
+                # Costs
+                costs = [trans_cost, sub_cost, ins_cost, del_cost]
+                # Get the index of the cheapest (first cheapest if tied)
+                l = costs.index(min(costs))
+                # Save the cost and the op in the band
+                cost_matrix[cell] = costs[l]
+                op_matrix[cell] = l
+                if l == 0: trans_matrix[cell] = trans_k+1
+        # The band is sufficient if the cheapest alignment is certain
+        if cost(o_len, c_len) < limit:
+            return cost_matrix, op_matrix, trans_matrix
+        return None
+
+    # Input 1: The Features of the orig tokens
+    # Input 2: The Features of the cor tokens
+    # Output: The standard Levenshtein distance between the token orths
+    def get_lev_distance(self, orig, cor):
+        return Levenshtein.distance(*self.get_lev_ids(orig, cor))
+
+    # Input 1: The Features of the orig tokens
+    # Input 2: The Features of the cor tokens
+    # Output 1: The orig token orths as small integer IDs for rapidfuzz
+    # Output 2: The cor token orths as small integer IDs for rapidfuzz
+    def get_lev_ids(self, orig, cor):
+        ids = {}
+        o_ids = [ids.setdefault(orth, len(ids)) for orth in orig.orth]
+        c_ids = [ids.setdefault(orth, len(ids)) for orth in cor.orth]
+        return o_ids, c_ids
+
+    # Raise an AlignmentTimeout if the deadline has passed
+    def check_deadline(self):
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise AlignmentTimeout("The alignment exceeded its time limit.")
+
+    # Input 1: The number of orig tokens
+    # Input 2: The number of cor tokens
+    # Input 3: The number of cells
+    # Output: A zeroed array for the transposition sizes of the cells
+    # A transposition can never be longer than the shorter sequence.
+    def get_trans_array(self, o_len, c_len, size):
+        if min(o_len, c_len) < 2**16: return array("H", [0])*size
+        return array("L", [0])*size
+
+    # Input 1: Lower case orig token IDs
+    # Input 2: Lower case cor token IDs
+    # Output: A boolean matrix that is True at [i][j] if orig[i-k:i+1] and
+    # cor[j-k:j+1] might be a permutation of each other for some k >= 1
+    # Every token gets a random 64-bit hash, so permutations have equal hash
+    # sums. With prefix sums, the windows ending at [i][j] have equal sums iff
+    # o_sums[i+1]-c_sums[j+1] equals o_sums[i-k]-c_sums[j-k], i.e. iff that
+    # difference already occurred at least two cells up the same diagonal.
+    # Hash collisions only add candidates, so this is exact.
+    def get_trans_candidates(self, o_low, c_low):
+        import numpy as np
+        o_len = len(o_low)
+        c_len = len(c_low)
+        ids = {}
+        o_ids = np.array([ids.setdefault(low, len(ids)) for low in o_low], dtype=np.int64)
+        c_ids = np.array([ids.setdefault(low, len(ids)) for low in c_low], dtype=np.int64)
+        hashes = np.random.default_rng(0).integers(0, 2**63, len(ids),
+            dtype=np.uint64, endpoint=True)
+        # Prefix sums of the hashes; uint64 arithmetic wraps around
+        o_sums = np.zeros(o_len+1, dtype=np.uint64)
+        np.cumsum(hashes[o_ids], out=o_sums[1:])
+        c_sums = np.zeros(c_len+1, dtype=np.uint64)
+        np.cumsum(hashes[c_ids], out=c_sums[1:])
+        diffs = (o_sums[:, None] - c_sums[None, :]).ravel()
+        rows, cols = np.indices((o_len+1, c_len+1))
+        rows = rows.ravel()
+        diags = cols.ravel()-rows
+        # Sort the cells by diagonal, difference and row, and find the first
+        # row of every run of equal differences on the same diagonal
+        order = np.lexsort((rows, diffs, diags))
+        starts = np.ones(len(order), dtype=bool)
+        starts[1:] = (diags[order[1:]] != diags[order[:-1]]) | \
+            (diffs[order[1:]] != diffs[order[:-1]])
+        first = np.empty(len(order), dtype=np.int64)
+        first[order] = rows[order][np.maximum.accumulate(
+            np.where(starts, np.arange(len(order)), 0))]
+        first = first.reshape(o_len+1, c_len+1)
+        return first[1:, 1:] < np.arange(o_len)[:, None]
+
+    # Input 1: A cost matrix being filled in
+    # Input 2: Lower case orig token IDs
+    # Input 3: Lower case cor token IDs
+    # Input 4: An orig token index
+    # Input 5: A cor token index
+    # Output 1: The cost of the transposition ending at orig[i] and cor[j]
+    # Output 2: The transposition size minus 1
+    def get_trans_cost(self, cost_matrix, o_low, c_low, i, j):
+        # Traverse the diagonal while there is not a Match.
+        # Only sort the tokens if their ID sums are equal.
+        k = 1
+        o_sum = o_low[i]
+        c_sum = c_low[j]
+        while i-k >= 0 and j-k >= 0 and \
+                cost_matrix[i-k+1][j-k+1] != cost_matrix[i-k][j-k]:
+            o_sum += o_low[i-k]
+            c_sum += c_low[j-k]
+            if o_sum == c_sum and \
+                    sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                return cost_matrix[i-k][j-k] + k, k
+            k += 1
+        return float("inf"), k
+
+    # Input 1: The (lower, lemma, pos, text) key of an orig token
+    # Input 2: The (lower, lemma, pos, text) key of a cor token
     # Output: A linguistic cost between 0 < x < 2
     def get_sub_cost(self, o, c):
         # Short circuit if the only difference is case
-        if o.lower == c.lower: return 0
+        if o[0] == c[0]: return 0
+        return self.sub_cost(o, c)
+
+    # Input 1: The Features of the orig tokens
+    # Input 2: The Features of the cor tokens
+    # Output: A matrix of get_sub_cost for every orig and cor token pair
+    def get_sub_cost_matrix(self, orig, cor):
+        import numpy as np
+        # Token attributes as arrays
+        o_lower = np.array(orig.lower, dtype=np.uint64)
+        c_lower = np.array(cor.lower, dtype=np.uint64)
+        o_lemma = np.array(orig.lemma, dtype=np.uint64)
+        c_lemma = np.array(cor.lemma, dtype=np.uint64)
+        o_pos = np.array(orig.pos, dtype=np.uint64)
+        c_pos = np.array(cor.pos, dtype=np.uint64)
+        o_open = np.array([pos in self._open_pos for pos in orig.pos], dtype=bool)
+        c_open = np.array([pos in self._open_pos for pos in cor.pos], dtype=bool)
         # Lemma cost
-        if o.lemma == c.lemma: lemma_cost = 0
-        else: lemma_cost = 0.499
+        lemma_cost = np.where(o_lemma[:, None] == c_lemma[None, :], 0, 0.499)
         # POS cost
-        if o.pos == c.pos: pos_cost = 0
-        elif o.pos in self._open_pos and c.pos in self._open_pos: pos_cost = 0.25
-        else: pos_cost = 0.5
+        pos_cost = np.where(o_pos[:, None] == c_pos[None, :], 0,
+            np.where(o_open[:, None] & c_open[None, :], 0.25, 0.5))
         # Char cost
-        char_cost = Indel.normalized_distance(o.text, c.text)
+        char_cost = process.cdist(orig.text, cor.text,
+            scorer=Indel.normalized_distance,
+            dtype=np.float64)
         # Combine the costs
-        return lemma_cost + pos_cost + char_cost
+        sub_costs = lemma_cost + pos_cost + char_cost
+        # Short circuit if the only difference is case
+        sub_costs[o_lower[:, None] == c_lower[None, :]] = 0
+        return sub_costs
+
+    # Output 1: The number of leading tokens with the same orth in orig and cor
+    # Output 2: The number of trailing tokens with the same orth after those
+    def get_common_affixes(self):
+        o_orth = self.o_feats.orth
+        c_orth = self.c_feats.orth
+        max_len = min(len(o_orth), len(c_orth))
+        prefix = 0
+        while prefix < max_len and o_orth[prefix] == c_orth[prefix]:
+            prefix += 1
+        suffix = 0
+        while prefix+suffix < max_len and \
+                o_orth[-suffix-1] == c_orth[-suffix-1]:
+            suffix += 1
+        return prefix, suffix
+
+    # Input 1: An orig index i
+    # Input 2: A cor index j; i or j is at most the prefix length
+    # Output: The op in the full op matrix at [i][j]
+    # Every path to [i][j] needs at least |i-j| insertions or deletions, and
+    # because orig and cor share the first min(i, j) tokens, |i-j| is also the
+    # cost of the cheapest path. Transpositions and non-zero substitutions
+    # therefore always cost more than insertions or deletions here, and the
+    # aligned middle of the matrix gets the same edge costs as the full matrix.
+    def get_affix_op(self, i, j):
+        if i == 0: return "I"
+        if j == 0: return "D"
+        if self.o_feats.orth[i-1] == self.c_feats.orth[j-1]: return "M"
+        if not self.lev and self.o_feats.lower[i-1] == self.c_feats.lower[j-1]:
+            return "S"
+        if i < j: return "I"
+        return "D"
 
     # Get the cheapest alignment sequence and indices from the op matrix
     # align_seq = [(op, o_start, o_end, c_start, c_end), ...]
     def get_cheapest_align_seq(self):
-        i = len(self.op_matrix)-1
-        j = len(self.op_matrix[0])-1
+        p = self.prefix
+        i = len(self.orig)
+        j = len(self.cor)
         align_seq = []
+        # The common suffix is all matches
+        for k in range(self.suffix):
+            align_seq.append(("M", i-1, i, j-1, j))
+            i -= 1
+            j -= 1
         # Work backwards from bottom right until we hit top left
         while i + j != 0:
             # Get the edit operation in the current cell
-            op = self.op_matrix[i][j]
+            if i <= p or j <= p: op = self.get_affix_op(i, j)
+            else:
+                if self._band is None: cell = (i-p)*self._row_len+j-p
+                else: cell = (i-p)*self._row_len+j-i-self._band
+                op = self._op_names[self._ops[cell]]
+                if op == "T": op += str(self._trans[cell])
             # Matches and substitutions
             if op in {"M", "S"}:
                 align_seq.append((op, i-1, i, j-1, j))
@@ -132,6 +684,120 @@ class Alignment:
         align_seq.reverse()
         return align_seq
 
+    # Input 1: The Features of the orig tokens to align
+    # Input 2: The Features of the cor tokens to align
+    # Output: A list of (i, j) orig and cor indices of anchor tokens
+    # Anchors are tokens that occur exactly once in both orig and cor and have
+    # the same neighbours. The longest sequence of anchors that are in the same
+    # order in orig and cor is returned.
+    def get_anchors(self, orig, cor):
+        o_orths = orig.orth
+        c_orths = cor.orth
+        o_counts = Counter(o_orths)
+        c_counts = Counter(c_orths)
+        o_index = {orth: i for i, orth in enumerate(o_orths)
+            if o_counts[orth] == 1}
+        # Candidate anchors in cor order
+        cands = []
+        for j, orth in enumerate(c_orths):
+            if c_counts[orth] != 1 or orth not in o_index: continue
+            i = o_index[orth]
+            # The left neighbours must both be missing or match
+            if (i == 0 or j == 0) and i != j: continue
+            if i and j and o_orths[i-1] != c_orths[j-1]: continue
+            # The right neighbours must both be missing or match
+            o_last = i == len(o_orths)-1
+            c_last = j == len(c_orths)-1
+            if o_last != c_last: continue
+            if not o_last and o_orths[i+1] != c_orths[j+1]: continue
+            cands.append((i, j))
+        # Longest increasing subsequence of the orig indices
+        tails = []
+        tail_ids = []
+        prev = []
+        for n, (i, j) in enumerate(cands):
+            k = bisect_left(tails, i)
+            if k == len(tails):
+                tails.append(i)
+                tail_ids.append(n)
+            else:
+                tails[k] = i
+                tail_ids[k] = n
+            prev.append(tail_ids[k-1] if k else None)
+        anchors = []
+        n = tail_ids[-1] if tail_ids else None
+        while n is not None:
+            anchors.append(cands[n])
+            n = prev[n]
+        anchors.reverse()
+        return anchors
+
+    # Input 1: The Features of the orig tokens to align
+    # Input 2: The Features of the cor tokens to align
+    # Output: The align_seq of orig and cor, including the common affixes
+    # Matches the anchor tokens and aligns each gap between them with the
+    # banded engine if it has few edits, or else with the numpy engine. This
+    # is much faster for long documents, but is not guaranteed to find the
+    # same alignment as the other engines.
+    def get_document_align_seq(self, orig, cor):
+        p = self.prefix
+        align_seq = [("M", k, k+1, k, k+1) for k in range(p)]
+        i = j = 0
+        for a_i, a_j in self.get_anchors(orig, cor)+[(len(orig), len(cor))]:
+            # Align the gap before the anchor
+            if self.get_band_width(orig[i:a_i], cor[j:a_j]) is None:
+                engine = "numpy"
+            else: engine = "banded"
+            gap = Alignment(self.orig[p+i:p+a_i], self.cor[p+j:p+a_j], False,
+                engine, False, self.sub_cost, self.deadline)
+            for op, o_start, o_end, c_start, c_end in gap.align_seq:
+                align_seq.append((op, o_start+p+i, o_end+p+i,
+                    c_start+p+j, c_end+p+j))
+            # Match the anchor
+            if a_i < len(orig):
+                align_seq.append(("M", a_i+p, a_i+p+1, a_j+p, a_j+p+1))
+            i = a_i+1
+            j = a_j+1
+        # The common suffix is all matches
+        i = p+len(orig)
+        j = p+len(cor)
+        for k in range(self.suffix):
+            align_seq.append(("M", i+k, i+k+1, j+k, j+k+1))
+        return align_seq
+
+    # Input 1: The Features of the orig tokens to align
+    # Input 2: The Features of the cor tokens to align
+    # Output: The align_seq of orig and cor, including the common affixes
+    # A standard Levenshtein alignment from the rapidfuzz editops, which takes
+    # time and memory roughly linear in the sequence lengths. It has the same
+    # cost as the lev alignment of the other engines, but the ties between S,
+    # I and D may be broken differently.
+    def get_editops_align_seq(self, orig, cor):
+        p = self.prefix
+        align_seq = [("M", k, k+1, k, k+1) for k in range(p)]
+        i = j = p
+        editops = list(Levenshtein.editops(*self.get_lev_ids(orig, cor)))
+        for op, o_pos, c_pos in editops+[("end", len(orig), len(cor))]:
+            # The tokens between the edit operations are matches
+            while i < p+o_pos:
+                align_seq.append(("M", i, i+1, j, j+1))
+                i += 1
+                j += 1
+            if op == "replace":
+                align_seq.append(("S", i, i+1, j, j+1))
+                i += 1
+                j += 1
+            elif op == "delete":
+                align_seq.append(("D", i, i+1, j, j))
+                i += 1
+            elif op == "insert":
+                align_seq.append(("I", i, i, j, j+1))
+                j += 1
+        # The common suffix is all matches
+        for k in range(self.suffix):
+            align_seq.append(("M", i+k, i+k+1, j+k, j+k+1))
+        return align_seq
+
     # all-split: Don't merge anything
     def get_all_split_edits(self):
         edits = []
@@ -172,3 +838,25 @@ class Alignment:
         op_matrix = "\n".join(["Operation Matrix:"]+[str(row) for row in self.op_matrix])
         seq = "Best alignment: "+str([a[0] for a in self.align_seq])
         return "\n".join([orig, cor, cost_matrix, op_matrix, seq])
+
+# Input 1: The (lower, lemma, pos, text) features of an orig token
+# Input 2: The (lower, lemma, pos, text) features of a cor token
+# Output: A linguistic cost between 0 < x < 2
+# The features are hashable so that the function can be memoized.
+def get_feature_sub_cost(o, c):
+    o_lower, o_lemma, o_pos, o_text = o
+    c_lower, c_lemma, c_pos, c_text = c
+    # Short circuit if the only difference is case
+    if o_lower == c_lower: return 0
+    # Lemma cost
+    if o_lemma == c_lemma: lemma_cost = 0
+    else: lemma_cost = 0.499
+    # POS cost
+    if o_pos == c_pos: pos_cost = 0
+    elif o_pos in Alignment._open_pos and c_pos in Alignment._open_pos:
+        pos_cost = 0.25
+    else: pos_cost = 0.5
+    # Char cost
+    char_cost = Indel.normalized_distance(o_text, c_text)
+    # Combine the costs
+    return lemma_cost + pos_cost + char_cost
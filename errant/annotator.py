@@ -1,5 +1,11 @@
-from errant.alignment import Alignment
+from functools import lru_cache
+from time import perf_counter
+import warnings
+from collections import deque
+from errant.alignment import Alignment, AlignmentTimeout, get_feature_sub_cost
+from errant.cache import ParseCache, ResultCache
 from errant.edit import Edit
+from errant.features import get_features
 from spacy.tokens import Doc
 
 # Main ERRANT Annotator class
@@ -9,29 +15,183 @@ class Annotator:
     # Input 2: A spacy processing object for the language
     # Input 3: A merging module for the language
     # Input 4: A classifier module for the language
-    def __init__(self, lang, nlp=None, merger=None, classifier=None):
+    # Input 5: The max number of token pair substitution costs to cache
+    def __init__(self, lang, nlp=None, merger=None, classifier=None,
+            sub_cost_cache_size=65536):
         self.lang = lang
         self.nlp = nlp
         self.merger = merger
         self.classifier = classifier
+        self.set_sub_cost_cache(sub_cost_cache_size)
+        # No limits on the linguistic alignments of annotate by default
+        self.set_limits()
+        # The number of annotated pairs that used the fallback alignment
+        self.fallbacks = 0
+        # No parse, result or classify cache by default
+        self.parse_cache = None
+        self.result_cache = None
+        self.classify_cache = None
+        # The pipeline components that are only run when the classifier needs
+        # dependency labels; none by default
+        self.lazy_deps = []
+
+    # Input: A flag to only dependency parse when the classifier needs it
+    # parse and parse_batch skip the components that assign dependencies (and
+    # any later components that require them); the classifier runs them on
+    # the Doc on first use. The classifications are the same as without it.
+    def set_lazy_deps(self, lazy=True):
+        self.lazy_deps = []
+        if not lazy: return
+        deps = {"token.dep", "token.head"}
+        for name in self.nlp.pipe_names:
+            meta = self.nlp.get_pipe_meta(name)
+            if deps & set(meta.assigns) or deps & set(meta.requires):
+                self.lazy_deps.append(name)
+                deps |= set(meta.assigns)
+
+    # Input 1: The max number of parsed texts to keep in memory
+    # Input 2: A directory to also store the parsed texts on disk
+    # Caches parse and parse_batch; replaces any previous parse cache.
+    def set_parse_cache(self, maxsize=10000, path=None):
+        self.parse_cache = ParseCache(self.nlp, maxsize, path)
+
+    # Input 1: The max number of tokens in orig or cor
+    # Input 2: The max number of alignment matrix cells; len(orig)*len(cor)
+    # Input 3: The max number of seconds for an alignment
+    # Pairs that exceed a limit in annotate fall back to Levenshtein alignment
+    # with the editops engine. None means no limit.
+    def set_limits(self, max_tokens=None, max_cells=None, max_seconds=None):
+        self.max_tokens = max_tokens
+        self.max_cells = max_cells
+        self.max_seconds = max_seconds
+
+    # Input: The max number of token pair substitution costs to cache
+    # The cache is shared by all alignments and replaces any previous cache.
+    def set_sub_cost_cache(self, maxsize):
+        self.sub_cost = lru_cache(maxsize=maxsize)(get_feature_sub_cost)
+
+    # Output: The hits, misses, maxsize and currsize of the sub cost cache
+    def sub_cost_cache_info(self):
+        return self.sub_cost.cache_info()
+
+    # Input: The max number of edit signatures to cache, or None for no cache
+    # Caches the error types of classify by the token attributes of the edits;
+    # replaces any previous cache. The cache belongs to this annotator, and
+    # is only used if the classifier has an EditCache class.
+    def set_classify_cache(self, maxsize=100000):
+        self.classify_cache = None
+        if not maxsize: return
+        edit_cache = getattr(self.classifier, "EditCache", None)
+        if edit_cache is None:
+            warnings.warn("The classifier does not support a cache.")
+        else: self.classify_cache = edit_cache(maxsize)
+
+    # Output: A dict of the classify cache statistics, or None if no cache
+    def classify_cache_info(self):
+        if self.classify_cache is None: return None
+        return self.classify_cache.info()
+
+    # Input 1: The path of an sqlite database file
+    # Input 2: The max number of results to keep in the database
+    # Caches the results of annotate_text across runs.
+    def set_result_cache(self, path, max_entries=1000000):
+        if self.result_cache is not None: self.result_cache.close()
+        self.result_cache = ResultCache(path, self.nlp, max_entries)
 
     # Input 1: A text string
     # Input 2: A flag for word tokenisation
     # Output: The input string parsed by spacy
     def parse(self, text, tokenise=False):
+        # Check the parse cache
+        if self.parse_cache is not None:
+            key = self.parse_cache.get_key(text, tokenise, bool(self.lazy_deps))
+            doc = self.parse_cache.get(key)
+            if doc is not None: return doc
         # Create Doc object from pretokenised text
         if not tokenise:
-            text = Doc(self.nlp.vocab, text.split())
+            doc = Doc(self.nlp.vocab, text.split())
+        else: doc = text
         # POS tag and parse
-        text = self.nlp(text)
-        return text
+        doc = self.nlp(doc, disable=self.lazy_deps)
+        self.prepare(doc)
+        if self.parse_cache is not None: self.parse_cache.put(key, doc)
+        return doc
+
+    # Input 1: An iterable of text strings (or unprocessed spacy Docs)
+    # Input 2: A flag for word tokenisation
+    # Input 3: The number of texts to buffer in spacy
+    # Input 4: The number of processes for spacy
+    # Output: A generator of the input strings parsed by spacy, in input order
+    def parse_batch(self, texts, tokenise=False, batch_size=1000, n_process=1):
+        if self.parse_cache is not None:
+            return self.parse_batch_cached(texts, tokenise, batch_size, n_process)
+        return self.pipe(texts, tokenise, batch_size, n_process)
+
+    # Same as parse_batch, but without the parse cache
+    def pipe(self, texts, tokenise, batch_size, n_process):
+        # Create Doc objects from pretokenised text
+        if not tokenise:
+            texts = (Doc(self.nlp.vocab, text.split())
+                if isinstance(text, str) else text for text in texts)
+        # POS tag and parse
+        docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process,
+            disable=self.lazy_deps)
+        for doc in docs:
+            self.prepare(doc)
+            yield doc
+
+    # Input: A spacy Doc that was just parsed
+    # Remembers the skipped components for the classifier and builds the token
+    # feature table that the alignment, merger and classifier read. The Doc
+    # keeps the components themselves, so the classifier runs the ones from
+    # the pipeline that parsed it.
+    def prepare(self, doc):
+        if self.lazy_deps:
+            doc.user_data["lazy_deps"] = [self.nlp.get_pipe(name)
+                for name in self.lazy_deps]
+        get_features(doc)
+
+    # Same as parse_batch, but only texts that are not in the parse cache are
+    # sent through spacy
+    def parse_batch_cached(self, texts, tokenise, batch_size, n_process):
+        # The cache key and cached Doc (or None) of each input text
+        pending = deque()
+        # Yield the texts that are not cached
+        def get_misses():
+            for text in texts:
+                key = None
+                doc = None
+                # Docs are never cached
+                if isinstance(text, str):
+                    key = self.parse_cache.get_key(text, tokenise,
+                        bool(self.lazy_deps))
+                    doc = self.parse_cache.get(key)
+                pending.append((key, doc))
+                if doc is None: yield text
+        parsed = self.pipe(get_misses(), tokenise, batch_size, n_process)
+        parsed_docs = deque()
+        while True:
+            # Yield the Docs in input order as soon as they are available
+            while pending and (pending[0][1] is not None or parsed_docs):
+                key, doc = pending.popleft()
+                if doc is None:
+                    doc = parsed_docs.popleft()
+                    if key is not None: self.parse_cache.put(key, doc)
+                yield doc
+            # Parse more texts
+            try: parsed_docs.append(next(parsed))
+            except StopIteration: break
+        # The remaining Docs are all cached
+        for key, doc in pending: yield doc
 
     # Input 1: An original text string parsed by spacy
     # Input 2: A corrected text string parsed by spacy
     # Input 3: A flag for standard Levenshtein alignment
+    # Input 4: The alignment engine; "python", "numpy", "banded" or "document"
+    # Input 5: A flag to keep the alignment matrices after the backtrace
     # Output: An Alignment object
-    def align(self, orig, cor, lev=False):
-        return Alignment(orig, cor, lev)
+    def align(self, orig, cor, lev=False, engine="python", keep_matrices=True):
+        return Alignment(orig, cor, lev, engine, keep_matrices, self.sub_cost)
 
     # Input 1: An Alignment object
     # Input 2: A flag for merging strategy
@@ -58,19 +218,171 @@ class Annotator:
     # Input: An Edit object
     # Output: The same Edit object with an updated error type
     def classify(self, edit):
-        return self.classifier.classify(edit)
+        if self.classify_cache is None: return self.classifier.classify(edit)
+        return self.classifier.classify(edit, self.classify_cache)
+
+    # Input: A list of Edit objects
+    # Output: The same Edit objects with updated error types
+    # Classifiers only need classify; classify_batch is optional.
+    def classify_batch(self, edits):
+        classify_batch = getattr(self.classifier, "classify_batch", None)
+        if classify_batch is None: return [self.classify(edit) for edit in edits]
+        if self.classify_cache is None: return classify_batch(edits)
+        return classify_batch(edits, self.classify_cache)
 
     # Input 1: An original text string parsed by spacy
     # Input 2: A corrected text string parsed by spacy
     # Input 3: A flag for standard Levenshtein alignment
     # Input 4: A flag for merging strategy
+    # Input 5: The alignment engine; "python", "numpy", "banded" or "document"
     # Output: A list of automatically extracted, typed Edit objects
-    def annotate(self, orig, cor, lev=False, merging="rules"):
-        alignment = self.align(orig, cor, lev)
+    def annotate(self, orig, cor, lev=False, merging="rules", engine="python"):
+        # Only the align_seq is needed to extract the edits
+        alignment = self.align_with_limits(orig, cor, lev, engine)
         edits = self.merge(alignment, merging)
-        for edit in edits:
-            edit = self.classify(edit)
-        return edits
+        return self.classify_batch(edits)
+
+    # Input 1: An iterable of (orig, cor) text string pairs
+    # Input 2: A flag for standard Levenshtein alignment
+    # Input 3: A flag for merging strategy
+    # Input 4: The alignment engine; "python", "numpy", "banded" or "document"
+    # Input 5: A flag for word tokenisation
+    # Input 6: The number of texts to buffer in spacy
+    # Input 7: The number of processes for spacy
+    # Output: A generator of the edits of each pair, in input order
+    def annotate_batch(self, pairs, lev=False, merging="rules", engine="python",
+            tokenise=False, batch_size=1000, n_process=1):
+        # Parse orig and cor in the same stream
+        texts = (text for pair in pairs for text in pair)
+        docs = self.parse_batch(texts, tokenise, batch_size, n_process)
+        for orig in docs:
+            cor = next(docs)
+            yield self.annotate(orig, cor, lev, merging, engine)
+
+    # Input 1: An original text string parsed by spacy
+    # Input 2: A corrected text string parsed by spacy
+    # Input 3: A flag for standard Levenshtein alignment
+    # Input 4: The alignment engine; "python", "numpy", "banded" or "document"
+    # Output: An Alignment object without matrices
+    # Falls back to a Levenshtein alignment with a warning if the linguistic
+    # alignment exceeds the token, cell or time limits. The fallback uses the
+    # editops engine, which is fast enough for any pair and has no limits.
+    def align_with_limits(self, orig, cor, lev=False, engine="python"):
+        # Levenshtein alignment is already the cheap fallback
+        if lev: return self.align(orig, cor, lev, engine, keep_matrices=False)
+        # Check the size limits before aligning
+        limit = self.get_size_limit(orig, cor)
+        # Align with the time limit
+        if limit is None:
+            deadline = None
+            if self.max_seconds is not None:
+                deadline = perf_counter()+self.max_seconds
+            try:
+                return Alignment(orig, cor, lev, engine, False,
+                    self.sub_cost, deadline)
+            except AlignmentTimeout:
+                limit = f"{self.max_seconds} seconds"
+        # Fall back to Levenshtein alignment
+        self.fallbacks += 1
+        warnings.warn(f"Alignment of {len(orig)} orig and {len(cor)} cor "
+            f"tokens exceeded the limit of {limit}; using Levenshtein alignment.")
+        return self.align(orig, cor, True, "editops", keep_matrices=False)
+
+    # Input 1: An original text string parsed by spacy
+    # Input 2: A corrected text string parsed by spacy
+    # Output: The token or cell limit that the pair exceeds, or None
+    def get_size_limit(self, orig, cor):
+        if self.max_tokens is not None and \
+                max(len(orig), len(cor)) > self.max_tokens:
+            return f"{self.max_tokens} tokens"
+        if self.max_cells is not None and \
+                len(orig)*len(cor) > self.max_cells:
+            return f"{self.max_cells} cells"
+        return None
+
+    # Input 1: An original text string
+    # Input 2: A corrected text string
+    # Input 3: A flag for standard Levenshtein alignment
+    # Input 4: A flag for merging strategy
+    # Input 5: The alignment engine; "python", "numpy", "banded" or "document"
+    # Input 6: A flag for word tokenisation
+    # Output 1: The orig tokens
+    # Output 2: A list of edits; [o_start, o_end, c_start, c_end, cat, cor]
+    # Output 3: A flag for the Levenshtein fallback
+    # Results are taken from the result cache if possible, which skips spacy.
+    def annotate_text(self, orig, cor, lev=False, merging="rules",
+            engine="python", tokenise=False):
+        return self.annotate_text_batch([(orig, cor)], lev, merging, engine,
+            tokenise)[0]
+
+    # Input 1: An iterable of (orig, cor) text string pairs
+    # Input 2: A flag for standard Levenshtein alignment
+    # Input 3: A flag for merging strategy
+    # Input 4: The alignment engine; "python", "numpy", "banded" or "document"
+    # Input 5: A flag for word tokenisation
+    # Input 6: The number of texts to buffer in spacy
+    # Output: A list of the annotate_text results of the pairs, in input order
+    # Only the pairs that are not in the result cache are parsed, in one
+    # parse_batch, and each distinct text is only parsed once.
+    def annotate_text_batch(self, pairs, lev=False, merging="rules",
+            engine="python", tokenise=False, batch_size=1000):
+        pairs = list(pairs)
+        keys = [None]*len(pairs)
+        results = [None]*len(pairs)
+        # Check the result cache. The token and cell limits decide whether a
+        # pair falls back, so they are part of the key.
+        if self.result_cache is not None:
+            for i, (orig, cor) in enumerate(pairs):
+                keys[i] = self.result_cache.get_key(orig, cor, lev, merging,
+                    engine, tokenise, self.max_tokens, self.max_cells)
+                results[i] = self.result_cache.get(keys[i])
+                # Cached fallbacks are still counted
+                if results[i] is not None and results[i][2]: self.fallbacks += 1
+        misses = [i for i, result in enumerate(results) if result is None]
+        # Parse the texts of the other pairs
+        texts = list(dict.fromkeys(text for i in misses for text in pairs[i]))
+        docs = dict(zip(texts, self.parse_batch(texts, tokenise, batch_size)))
+        for i in misses:
+            orig = docs[pairs[i][0]]
+            cor = docs[pairs[i][1]]
+            fallbacks = self.fallbacks
+            edits = self.annotate(orig, cor, lev, merging, engine)
+            fallback = self.fallbacks > fallbacks
+            results[i] = [[tok.text for tok in orig], [[e.o_start, e.o_end,
+                e.c_start, e.c_end, e.type, " ".join([tok.text for tok in e.c_toks])]
+                for e in edits], fallback]
+            # Fallbacks from the time limit depend on the machine and load,
+            # so they are not cached
+            if self.result_cache is not None and \
+                    (not fallback or self.get_size_limit(orig, cor) is not None):
+                self.result_cache.put(keys[i], results[i])
+        return results
+
+    # Input 1: A list of (orig, cor) text pairs parsed by spacy
+    # Input 2: A flag for merging strategy
+    # Output: A dict comparing the document engine with the full alignment
+    # The edits of the full alignment are the reference; precision and recall
+    # are based on exact edit spans.
+    def document_accuracy(self, pairs, merging="rules"):
+        report = {"pairs": 0, "same_alignment": 0, "tp": 0, "fp": 0, "fn": 0}
+        for orig, cor in pairs:
+            full = self.align(orig, cor, engine="banded", keep_matrices=False)
+            doc = self.align(orig, cor, engine="document", keep_matrices=False)
+            report["pairs"] += 1
+            if full.align_seq == doc.align_seq: report["same_alignment"] += 1
+            # Compare the edit spans
+            ref = {(e.o_start, e.o_end, e.c_start, e.c_end)
+                for e in self.merge(full, merging)}
+            hyp = {(e.o_start, e.o_end, e.c_start, e.c_end)
+                for e in self.merge(doc, merging)}
+            report["tp"] += len(ref & hyp)
+            report["fp"] += len(hyp - ref)
+            report["fn"] += len(ref - hyp)
+        # Precision and recall; 1 if there is nothing to find
+        tp, fp, fn = report["tp"], report["fp"], report["fn"]
+        report["precision"] = tp/(tp+fp) if tp+fp else 1.0
+        report["recall"] = tp/(tp+fn) if tp+fn else 1.0
+        return report
 
     # Input 1: An original text string parsed by spacy
     # Input 2: A corrected text string parsed by spacy
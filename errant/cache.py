@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from hashlib import sha256
+import json
+import os
+import sqlite3
+from time import time
+import spacy
+from spacy.tokens import DocBin
+
+# Input: A spacy processing object
+# Output: A short hash of the spacy version, the model name and version, the
+# enabled components and the config of the pipeline
+def get_pipeline_id(nlp):
+    meta = nlp.meta
+    info = [spacy.__version__, meta.get("lang"), meta.get("name"),
+        meta.get("version"), nlp.pipe_names, nlp.config.to_str()]
+    return sha256(json.dumps(info).encode("utf8")).hexdigest()[:16]
+
+# A cache of spacy Docs keyed by text, tokenisation and spacy pipeline
+class ParseCache:
+
+    # Input 1: A spacy processing object
+    # Input 2: The max number of Docs to keep in memory
+    # Input 3: A directory for the on-disk cache (default: memory only)
+    def __init__(self, nlp, maxsize=10000, path=None):
+        self.nlp = nlp
+        self.maxsize = maxsize
+        self.path = path
+        # Cached Docs in least recently used order
+        self.docs = OrderedDict()
+        # Pipeline ids for each set of enabled pipeline components
+        self.pipeline_ids = {}
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # Output: The pipeline id of the current spacy pipeline
+    # The cache keys change whenever the pipeline does, so old entries are
+    # never reused.
+    def get_pipeline_id(self):
+        names = tuple(self.nlp.pipe_names)
+        if names not in self.pipeline_ids:
+            self.pipeline_ids[names] = get_pipeline_id(self.nlp)
+        return self.pipeline_ids[names]
+
+    # Input 1: A text string
+    # Input 2: A flag for word tokenisation
+    # Input 3: A flag for lazy dependency parsing
+    # Output: The cache key of the text
+    def get_key(self, text, tokenise, lazy_deps=False):
+        key = json.dumps([self.get_pipeline_id(), text, bool(tokenise),
+            bool(lazy_deps)])
+        return sha256(key.encode("utf8")).hexdigest()
+
+    # Input: A cache key
+    # Output: The path of the Doc on disk
+    def get_doc_path(self, key):
+        return os.path.join(self.path, key[:2], key+".spacy")
+
+    # Input: A cache key
+    # Output: The cached Doc or None
+    def get(self, key):
+        # Memory
+        doc = self.docs.get(key)
+        if doc is not None:
+            self.docs.move_to_end(key)
+            self.hits += 1
+            return doc
+        # Disk
+        if self.path is not None:
+            try:
+                with open(self.get_doc_path(key), "rb") as f:
+                    doc_bin = DocBin().from_bytes(f.read())
+                doc = next(doc_bin.get_docs(self.nlp.vocab))
+                self.add(key, doc)
+                self.disk_hits += 1
+                return doc
+            except (OSError, ValueError, StopIteration):
+                pass
+        self.misses += 1
+        return None
+
+    # Input 1: A cache key
+    # Input 2: A spacy Doc
+    # Stores the Doc in memory and on disk
+    # Docs that are not dependency parsed yet are only stored in memory, since
+    # the parser needs the doc.tensor, which is not serialized.
+    def put(self, key, doc):
+        self.add(key, doc)
+        if self.path is not None and "lazy_deps" not in doc.user_data:
+            doc_path = self.get_doc_path(key)
+            os.makedirs(os.path.dirname(doc_path), exist_ok=True)
+            # Write to a temporary file first so that other processes never
+            # read a partial Doc
+            tmp_path = f"{doc_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(DocBin(docs=[doc]).to_bytes())
+            os.replace(tmp_path, doc_path)
+
+    # Input 1: A cache key
+    # Input 2: A spacy Doc
+    # Stores the Doc in memory and evicts the least recently used Docs
+    def add(self, key, doc):
+        self.docs[key] = doc
+        self.docs.move_to_end(key)
+        while len(self.docs) > self.maxsize:
+            self.docs.popitem(last=False)
+
+    # Output: A dict of the cache statistics
+    def info(self):
+        lookups = self.hits+self.disk_hits+self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits,
+            "misses": self.misses, "size": len(self.docs),
+            "hit_rate": (self.hits+self.disk_hits)/lookups if lookups else 0.0}
+
+# A persistent sqlite cache of annotation results keyed by the input texts,
+# the annotation options and the ERRANT and spacy pipeline versions
+class ResultCache:
+
+    # Input 1: The path of the sqlite database file
+    # Input 2: A spacy processing object
+    # Input 3: The max number of results to keep; the least recently used
+    # results are evicted after every 10% of max_entries (at most 1000) new
+    # results
+    def __init__(self, path, nlp, max_entries=1000000):
+        self.path = path
+        self.nlp = nlp
+        self.max_entries = max_entries
+        self.evict_every = max(1, min(1000, max_entries//10))
+        # Pipeline ids for each set of enabled pipeline components
+        self.pipeline_ids = {}
+        # Autocommit with a write-ahead log so that several processes can
+        # share the database
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evict()
+
+    # Input: Any JSON serializable annotation options and texts
+    # Output: The cache key of the result
+    def get_key(self, *args):
+        from errant import __version__
+        names = tuple(self.nlp.pipe_names)
+        if names not in self.pipeline_ids:
+            self.pipeline_ids[names] = get_pipeline_id(self.nlp)
+        key = json.dumps([__version__, self.pipeline_ids[names], *args])
+        return sha256(key.encode("utf8")).hexdigest()
+
+    # Input: A cache key
+    # Output: The cached result or None
+    def get(self, key):
+        row = self.db.execute("SELECT value FROM results WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE results SET used = ? WHERE key = ?",
+            (time(), key))
+        return json.loads(row[0])
+
+    # Input 1: A cache key
+    # Input 2: A JSON serializable result
+    def put(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (key, json.dumps(value), time()))
+        self.puts += 1
+        if self.puts % self.evict_every == 0: self.evict()
+
+    # Delete the least recently used results above max_entries
+    def evict(self):
+        count = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute("DELETE FROM results WHERE key IN (SELECT key "
+                "FROM results ORDER BY used LIMIT ?)", (count-self.max_entries,))
+
+    # Output: A dict of the cache statistics
+    def info(self):
+        lookups = self.hits+self.misses
+        size = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size,
+            "hit_rate": self.hits/lookups if lookups else 0.0}
+
+    # Evict any extra results and close the database
+    def close(self):
+        self.evict()
+        self.db.close()
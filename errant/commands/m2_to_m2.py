@@ -1,78 +1,155 @@
 import argparse
+from collections import deque
+from contextlib import ExitStack
+from itertools import islice
+from multiprocessing import Pool
 import errant
 
+# The annotator and command line args of the current process
+annotator = None
+options = None
+
 def main():
     # Parse command line args
     args = parse_args()
     print("Loading resources...")
-    # Load Errant
-    annotator = errant.load("en")
+    # Load Errant in this process; the workers of a pool load it themselves
+    if args.workers == 1: init_worker(args)
 
     print("Processing M2 file...")
     # Open the m2 file and split it into text+edits blocks. Also open out_m2.
-    with open(args.m2_file) as m2, open(args.out, "w") as out_m2:
-        # Store the current m2_block here
-        m2_block = []
-        # Loop through m2 lines
-        for line in m2:
-            line = line.strip()
-            # If the line isn't empty, add it to the m2_block
-            if line: m2_block.append(line)
-            # Otherwise, process the complete blocks
-            else:
-                # Write the original text to the output M2 file
-                out_m2.write(m2_block[0]+"\n")
-                # Parse orig with spacy
-                orig = annotator.parse(m2_block[0][2:])
-                # Simplify the edits and sort by coder id
-                edit_dict = simplify_edits(m2_block[1:])
-                # Loop through coder ids
-                for id, raw_edits in sorted(edit_dict.items()):
-                    # If the first edit is a noop
-                    if raw_edits[0][2] == "noop":
-                        # Write the noop and continue
-                        out_m2.write(noop_edit(id)+"\n")
-                        continue
-                    # Apply the edits to generate the corrected text
-                    # Also redefine the edits as orig and cor token offsets
-                    cor, gold_edits = get_cor_and_edits(m2_block[0][2:], raw_edits)
-                    # Parse cor with spacy
-                    cor = annotator.parse(cor)
-                    # Save detection edits here for auto
-                    det_edits = []
-                    # Loop through the gold edits
-                    for gold_edit in gold_edits:
-                        # Do not minimise detection edits
-                        if gold_edit[-2] in {"Um", "UNK"}:
-                            edit = annotator.import_edit(orig, cor, gold_edit[:-1],
-                                min=False, old_cat=args.old_cats)
-                            # Overwrite the pseudo correction and set it in the edit
-                            edit.c_toks = annotator.parse(gold_edit[-1])
-                            # Save the edit for auto
-                            det_edits.append(edit)
-                            # Write the edit for gold
-                            if args.gold:
-                                # Write the edit
-                                out_m2.write(edit.to_m2(id)+"\n")
-                        # Gold annotation
-                        elif args.gold:
-                            edit = annotator.import_edit(orig, cor, gold_edit[:-1],
-                                not args.no_min, args.old_cats)
-                            # Write the edit
-                            out_m2.write(edit.to_m2(id)+"\n")
-                    # Auto annotations
-                    if args.auto:
-                        # Auto edits
-                        edits = annotator.annotate(orig, cor, args.lev, args.merge)
-                        # Combine detection and auto edits and sort by orig offsets
-                        edits = sorted(det_edits+edits, key=lambda e:(e.o_start, e.o_end))
-                        # Write the edits to the output M2 file
-                        for edit in edits:
-                            out_m2.write(edit.to_m2(id)+"\n")
-                # Write a newline when there are no more edits
-                out_m2.write("\n")
-                # Reset the m2 block
-                m2_block = []
+    with ExitStack() as stack, open(args.m2_file) as m2, \
+            open(args.out, "w") as out_m2:
+        # The worker pool is terminated with the files, even on errors
+        if args.workers > 1:
+            pool = stack.enter_context(Pool(args.workers, init_worker, (args,)))
+        # Process the m2 blocks in chunks
+        blocks = get_m2_blocks(m2)
+        chunks = iter(lambda: list(islice(blocks, args.chunk_size)), [])
+        fallbacks = 0
+        # Single process
+        if args.workers == 1:
+            for chunk in chunks:
+                m2_out, chunk_fallbacks = process_chunk(chunk)
+                out_m2.write(m2_out)
+                fallbacks += chunk_fallbacks
+        # Worker pool: write the chunks in input order, and only keep a few
+        # chunks per worker in memory
+        else:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(process_chunk, (chunk,)))
+                while len(pending) > 2*args.workers or \
+                        (pending and pending[0].ready()):
+                    m2_out, chunk_fallbacks = pending.popleft().get()
+                    out_m2.write(m2_out)
+                    fallbacks += chunk_fallbacks
+            while pending:
+                m2_out, chunk_fallbacks = pending.popleft().get()
+                out_m2.write(m2_out)
+                fallbacks += chunk_fallbacks
+    # Report how many pairs exceeded the alignment limits
+    print(f"Pairs aligned with the Levenshtein fallback: {fallbacks}")
+
+# Input: The command line args
+# Loads Errant once per process
+def init_worker(args):
+    global annotator, options
+    options = args
+    annotator = errant.load("en")
+    annotator.set_limits(args.max_tokens, args.max_cells, args.max_seconds)
+    if args.parse_cache: annotator.set_parse_cache(path=args.parse_cache)
+    if args.lazy_deps: annotator.set_lazy_deps()
+
+# Input: An open m2 file
+# Output: A generator of m2 blocks; each is a list of the text and edit lines
+# Only blocks that are followed by an empty line are complete.
+def get_m2_blocks(m2):
+    # Store the current m2_block here
+    m2_block = []
+    # Loop through m2 lines
+    for line in m2:
+        line = line.strip()
+        # If the line isn't empty, add it to the m2_block
+        if line: m2_block.append(line)
+        # Otherwise, the block is complete
+        else:
+            yield m2_block
+            # Reset the m2 block
+            m2_block = []
+
+# Input: A list of m2 blocks
+# Output 1: The output m2 of the blocks
+# Output 2: The number of pairs aligned with the fallback
+def process_chunk(m2_blocks):
+    fallbacks = annotator.fallbacks
+    # Get the corrected text and edits of each coder in each block
+    texts = []
+    block_coders = []
+    for m2_block in m2_blocks:
+        texts.append(m2_block[0][2:])
+        coders = []
+        # Simplify the edits and sort by coder id
+        edit_dict = simplify_edits(m2_block[1:])
+        # Loop through coder ids
+        for id, raw_edits in sorted(edit_dict.items()):
+            # If the first edit is a noop, there is nothing to parse
+            if raw_edits[0][2] == "noop":
+                coders.append((id, None))
+                continue
+            # Apply the edits to generate the corrected text
+            # Also redefine the edits as orig and cor token offsets
+            cor, gold_edits = get_cor_and_edits(m2_block[0][2:], raw_edits)
+            texts.append(cor)
+            coders.append((id, gold_edits))
+        block_coders.append(coders)
+    # Parse orig and cor with spacy
+    docs = annotator.parse_batch(texts)
+    out_m2 = []
+    for m2_block, coders in zip(m2_blocks, block_coders):
+        # Write the original text to the output M2 file
+        out_m2.append(m2_block[0]+"\n")
+        orig = next(docs)
+        for id, gold_edits in coders:
+            # Write the noop
+            if gold_edits is None:
+                out_m2.append(noop_edit(id)+"\n")
+                continue
+            cor = next(docs)
+            # Save detection edits here for auto
+            det_edits = []
+            # Loop through the gold edits
+            for gold_edit in gold_edits:
+                # Do not minimise detection edits
+                if gold_edit[-2] in {"Um", "UNK"}:
+                    edit = annotator.import_edit(orig, cor, gold_edit[:-1],
+                        min=False, old_cat=options.old_cats)
+                    # Overwrite the pseudo correction and set it in the edit
+                    edit.c_toks = annotator.parse(gold_edit[-1])
+                    # Save the edit for auto
+                    det_edits.append(edit)
+                    # Write the edit for gold
+                    if options.gold:
+                        # Write the edit
+                        out_m2.append(edit.to_m2(id)+"\n")
+                # Gold annotation
+                elif options.gold:
+                    edit = annotator.import_edit(orig, cor, gold_edit[:-1],
+                        not options.no_min, options.old_cats)
+                    # Write the edit
+                    out_m2.append(edit.to_m2(id)+"\n")
+            # Auto annotations
+            if options.auto:
+                # Auto edits
+                edits = annotator.annotate(orig, cor, options.lev, options.merge)
+                # Combine detection and auto edits and sort by orig offsets
+                edits = sorted(det_edits+edits, key=lambda e:(e.o_start, e.o_end))
+                # Write the edits to the output M2 file
+                for edit in edits:
+                    out_m2.append(edit.to_m2(id)+"\n")
+        # Write a newline when there are no more edits
+        out_m2.append("\n")
+    return "".join(out_m2), annotator.fallbacks-fallbacks
 
 # Parse command line args
 def parse_args():
@@ -117,9 +194,46 @@ def parse_args():
             "all-equal: Merge adjacent same-type non-matches: MSSDI -> M, SS, D, I",
         choices = ["rules", "all-split", "all-merge", "all-equal"],
         default = "rules")
+    parser.add_argument(
+        "-max_tokens",
+        help = "Use Levenshtein alignment for sentences with more tokens.",
+        type = int)
+    parser.add_argument(
+        "-max_cells",
+        help = "Use Levenshtein alignment if len(orig)*len(cor) is larger.",
+        type = int)
+    parser.add_argument(
+        "-max_seconds",
+        help = "Use Levenshtein alignment if an alignment takes longer.",
+        type = float)
+    parser.add_argument(
+        "-parse_cache",
+        help = "A directory to cache the parsed texts in.")
+    parser.add_argument(
+        "-lazy_deps",
+        help = "Only dependency parse the sentences whose edits need it.",
+        action = "store_true")
+    parser.add_argument(
+        "-workers",
+        help = "The number of processes.",
+        type = positive_int,
+        default = 1)
+    parser.add_argument(
+        "-chunk_size",
+        help = "The number of m2 blocks each process parses and annotates at once.",
+        type = positive_int,
+        default = 1000)
     args = parser.parse_args()
     return args
 
+# Input: A command line arg string
+# Output: The arg as an integer; an error if it is less than 1
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer.")
+    return number
+
 # Input: A list of edit lines from an m2 file
 # Output: An edit dictionary; key is coder id, value is a list of edits
 def simplify_edits(edits):
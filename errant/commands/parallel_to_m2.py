@@ -1,48 +1,164 @@
 import argparse
+from collections import Counter, deque
 from contextlib import ExitStack
+from itertools import islice
+from multiprocessing import Pool
 import errant
 
+# The annotator and command line args of the current process
+annotator = None
+options = None
+
 def main():
     # Parse command line args
     args = parse_args()
     print("Loading resources...")
-    # Load Errant
-    annotator = errant.load("en")
+    # Load Errant in this process; the workers of a pool load it themselves
+    if args.workers == 1: init_worker(args)
 
     print("Processing parallel files...")
     # Process an arbitrary number of files line by line simultaneously. Python 3.3+
     # See https://tinyurl.com/y4cj4gth . Also opens the output m2 file.
     with ExitStack() as stack, open(args.out, "w") as out_m2:
         in_files = [stack.enter_context(open(i)) for i in [args.orig]+args.cor]
-        # Process each line of all input files
-        for line in zip(*in_files):
-            # Get the original and all the corrected texts
-            orig = line[0].strip()
-            cors = line[1:]
-            # Skip the line if orig is empty
-            if not orig: continue
-            # Parse orig with spacy
-            orig = annotator.parse(orig, args.tok)
-            # Write orig to the output m2 file
-            out_m2.write(" ".join(["S"]+[token.text for token in orig])+"\n")
-            # Loop through the corrected texts
-            for cor_id, cor in enumerate(cors):
-                cor = cor.strip()
-                # If the texts are the same, write a noop edit
-                if orig.text.strip() == cor:
-                    out_m2.write(noop_edit(cor_id)+"\n")
-                # Otherwise, do extra processing
-                else:
-                    # Parse cor with spacy
-                    cor = annotator.parse(cor, args.tok)
-                    # Align the texts and extract and classify the edits
-                    edits = annotator.annotate(orig, cor, args.lev, args.merge)
-                    # Loop through the edits
-                    for edit in edits:
-                        # Write the edit to the output m2 file
-                        out_m2.write(edit.to_m2(cor_id)+"\n")
-            # Write a newline when we have processed all corrections for each line
-            out_m2.write("\n")
+        # The worker pool is terminated with the files, even on errors
+        if args.workers > 1:
+            pool = stack.enter_context(Pool(args.workers, init_worker, (args,)))
+        # Process the lines of all input files in chunks
+        lines = zip(*in_files)
+        chunks = iter(lambda: list(islice(lines, args.chunk_size)), [])
+        stats = Counter()
+        # Single process
+        if args.workers == 1:
+            for chunk in chunks:
+                m2, chunk_stats = process_chunk(chunk)
+                out_m2.write(m2)
+                stats += chunk_stats
+        # Worker pool: write the chunks in input order, and only keep a few
+        # chunks per worker in memory
+        else:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(process_chunk, (chunk,)))
+                while len(pending) > 2*args.workers or \
+                        (pending and pending[0].ready()):
+                    m2, chunk_stats = pending.popleft().get()
+                    out_m2.write(m2)
+                    stats += chunk_stats
+            while pending:
+                m2, chunk_stats = pending.popleft().get()
+                out_m2.write(m2)
+                stats += chunk_stats
+    if args.workers == 1 and annotator.result_cache is not None:
+        annotator.result_cache.close()
+    # Report how many pairs exceeded the alignment limits
+    print(f"Pairs aligned with the Levenshtein fallback: {stats['fallbacks']}")
+    # Report the result cache hit rate
+    if args.result_cache:
+        lookups = stats["hits"]+stats["misses"]
+        print(f"Result cache hits: {stats['hits']}/{lookups}")
+
+# Input: The command line args
+# Loads Errant once per process
+def init_worker(args):
+    global annotator, options
+    options = args
+    annotator = errant.load("en")
+    annotator.set_limits(args.max_tokens, args.max_cells, args.max_seconds)
+    if args.parse_cache: annotator.set_parse_cache(path=args.parse_cache)
+    if args.result_cache: annotator.set_result_cache(args.result_cache)
+    if args.lazy_deps: annotator.set_lazy_deps()
+
+# Input: A list of lines; each is a tuple of the orig and cor texts
+# Output 1: The m2 output of the lines
+# Output 2: A Counter of the pairs aligned with the fallback, and the result
+# cache hits and misses
+def process_chunk(lines):
+    if annotator.result_cache is not None:
+        return process_chunk_cached(lines)
+    fallbacks = annotator.fallbacks
+    out_m2 = []
+    # Skip the lines where orig is empty
+    lines = [line for line in lines if line[0].strip()]
+    # Parse orig with spacy
+    origs = list(annotator.parse_batch(
+        [line[0].strip() for line in lines], options.tok))
+    # Parse the corrected texts that are not the same as orig with spacy
+    cors = annotator.parse_batch([cor.strip()
+        for orig, line in zip(origs, lines) for cor in line[1:]
+        if orig.text.strip() != cor.strip()], options.tok)
+    for orig, line in zip(origs, lines):
+        # Write orig to the output m2 file
+        out_m2.append(" ".join(["S"]+[token.text for token in orig])+"\n")
+        # Loop through the corrected texts
+        for cor_id, cor in enumerate(line[1:]):
+            cor = cor.strip()
+            # If the texts are the same, write a noop edit
+            if orig.text.strip() == cor:
+                out_m2.append(noop_edit(cor_id)+"\n")
+            # Otherwise, do extra processing
+            else:
+                # Get the parsed cor
+                cor = next(cors)
+                # Align the texts and extract and classify the edits
+                edits = annotator.annotate(orig, cor, options.lev, options.merge)
+                # Loop through the edits
+                for edit in edits:
+                    # Write the edit to the output m2 file
+                    out_m2.append(edit.to_m2(cor_id)+"\n")
+        # Write a newline when we have processed all corrections for each line
+        out_m2.append("\n")
+    return "".join(out_m2), Counter(fallbacks=annotator.fallbacks-fallbacks)
+
+# Same as process_chunk, but uses the result cache of the annotator; cached
+# pairs skip spacy entirely.
+def process_chunk_cached(lines):
+    fallbacks = annotator.fallbacks
+    hits = annotator.result_cache.hits
+    misses = annotator.result_cache.misses
+    out_m2 = []
+    # Get the original and all the corrected texts of each line
+    texts = []
+    for line in lines:
+        orig = line[0].strip()
+        # Skip the line if orig is empty
+        if not orig: continue
+        # The orig text as it would be parsed by spacy
+        if not options.tok: orig = " ".join(orig.split())
+        texts.append((orig, [cor.strip() for cor in line[1:]]))
+    # Align the texts that are not the same and extract and classify the edits
+    # of the whole chunk at once
+    results = iter(annotator.annotate_text_batch([(orig, cor)
+        for orig, cors in texts for cor in cors if orig != cor],
+        options.lev, options.merge, tokenise=options.tok))
+    results = [[next(results) if orig != cor else None for cor in cors]
+        for orig, cors in texts]
+    # Parse the origs that have no results to get their tokens
+    unparsed = annotator.parse_batch([orig for (orig, cors), line_results
+        in zip(texts, results) if not any(line_results)], options.tok)
+    for (orig, cors), line_results in zip(texts, results):
+        # Get the orig tokens
+        orig_toks = next((result[0] for result in line_results if result), None)
+        if orig_toks is None:
+            orig_toks = [token.text for token in next(unparsed)]
+        # Write orig to the output m2 file
+        out_m2.append(" ".join(["S"]+orig_toks)+"\n")
+        # Loop through the corrected texts
+        for cor_id, result in enumerate(line_results):
+            # If the texts are the same, write a noop edit
+            if result is None:
+                out_m2.append(noop_edit(cor_id)+"\n")
+                continue
+            # Write the edits to the output m2 file
+            for o_start, o_end, c_start, c_end, cat, cor in result[1]:
+                span = " ".join(["A", str(o_start), str(o_end)])
+                out_m2.append("|||".join([span, cat, cor, "REQUIRED",
+                    "-NONE-", str(cor_id)])+"\n")
+        # Write a newline when we have processed all corrections for each line
+        out_m2.append("\n")
+    return "".join(out_m2), Counter(fallbacks=annotator.fallbacks-fallbacks,
+        hits=annotator.result_cache.hits-hits,
+        misses=annotator.result_cache.misses-misses)
 
 # Parse command line args
 def parse_args():
@@ -81,9 +197,49 @@ def parse_args():
             "all-equal: Merge adjacent same-type non-matches: MSSDI -> M, SS, D, I",
         choices=["rules", "all-split", "all-merge", "all-equal"],
         default="rules")
+    parser.add_argument(
+        "-max_tokens",
+        help="Use Levenshtein alignment for sentences with more tokens (default: None).",
+        type=int)
+    parser.add_argument(
+        "-max_cells",
+        help="Use Levenshtein alignment if len(orig)*len(cor) is larger (default: None).",
+        type=int)
+    parser.add_argument(
+        "-max_seconds",
+        help="Use Levenshtein alignment if an alignment takes longer (default: None).",
+        type=float)
+    parser.add_argument(
+        "-parse_cache",
+        help="A directory to cache the parsed texts in (default: None).")
+    parser.add_argument(
+        "-result_cache",
+        help="An sqlite file to cache the edits of each sentence pair in (default: None).")
+    parser.add_argument(
+        "-lazy_deps",
+        help="Only dependency parse the sentences whose edits need it (default: False).",
+        action="store_true")
+    parser.add_argument(
+        "-workers",
+        help="The number of processes (default: 1).",
+        type=positive_int,
+        default=1)
+    parser.add_argument(
+        "-chunk_size",
+        help="The number of lines each process parses and annotates at once (default: 1000).",
+        type=positive_int,
+        default=1000)
     args=parser.parse_args()
     return args
 
+# Input: A command line arg string
+# Output: The arg as an integer; an error if it is less than 1
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer.")
+    return number
+
 # Input: A coder id
 # Output: A noop edit; i.e. text contains no edits
 def noop_edit(id=0):
@@ -1,51 +1,110 @@
+from errant.features import get_features
+
 # ERRANT edit class
+# Edits only store their offsets and the parsed texts; the spacy tokens and
+# strings are created when they are first used, since most edits are only
+# written to M2 files.
 class Edit:
+    __slots__ = ("orig", "cor", "o_start", "o_end", "c_start", "c_end",
+        "type", "_o_toks", "_c_toks", "_o_str", "_c_str")
 
     # Input 1: An original text string parsed by spacy
     # Input 2: A corrected text string parsed by spacy
     # Input 3: A token span edit list: [o_start, o_end, c_start, c_end]
     # Input 4: An error type string, if known
     def __init__(self, orig, cor, edit, type="NA"):
-        # Orig offsets, spacy tokens and string
+        self.orig = orig
+        self.cor = cor
+        # Orig offsets
         self.o_start = edit[0]
         self.o_end = edit[1]
-        self.o_toks = orig[self.o_start:self.o_end]
-        self.o_str = self.o_toks.text if self.o_toks else ""
-        # Cor offsets, spacy tokens and string
+        # Cor offsets
         self.c_start = edit[2]
         self.c_end = edit[3]
-        self.c_toks = cor[self.c_start:self.c_end]
-        self.c_str = self.c_toks.text if self.c_toks else ""
         # Error type
         self.type = type
+        # Spacy tokens and strings; created on first use
+        self._o_toks = None
+        self._c_toks = None
+        self._o_str = None
+        self._c_str = None
+
+    # Orig spacy tokens
+    @property
+    def o_toks(self):
+        if self._o_toks is None:
+            self._o_toks = self.orig[self.o_start:self.o_end]
+        return self._o_toks
+
+    @o_toks.setter
+    def o_toks(self, toks):
+        self._o_toks = toks
+
+    # Cor spacy tokens
+    @property
+    def c_toks(self):
+        if self._c_toks is None:
+            self._c_toks = self.cor[self.c_start:self.c_end]
+        return self._c_toks
+
+    @c_toks.setter
+    def c_toks(self, toks):
+        self._c_toks = toks
+
+    # Orig string
+    @property
+    def o_str(self):
+        if self._o_str is None:
+            self._o_str = self.orig[self.o_start:self.o_end].text
+        return self._o_str
+
+    @o_str.setter
+    def o_str(self, string):
+        self._o_str = string
+
+    # Cor string
+    @property
+    def c_str(self):
+        if self._c_str is None:
+            self._c_str = self.cor[self.c_start:self.c_end].text
+        return self._c_str
+
+    @c_str.setter
+    def c_str(self, string):
+        self._c_str = string
 
     # Minimise the edit; e.g. [a b -> a c] = [b -> c]
     def minimise(self):
+        o_text = get_features(self.orig).text
+        c_text = get_features(self.cor).text
         # While the first token is the same on both sides
-        while self.o_toks and self.c_toks and \
-                self.o_toks[0].text == self.c_toks[0].text:
+        while self.o_start < self.o_end and self.c_start < self.c_end and \
+                o_text[self.o_start] == c_text[self.c_start]:
             # Remove that token from the span, and adjust the start offsets
-            self.o_toks = self.o_toks[1:]
-            self.c_toks = self.c_toks[1:]
             self.o_start += 1
             self.c_start += 1
         # Do the same for the last token
-        while self.o_toks and self.c_toks and \
-                self.o_toks[-1].text == self.c_toks[-1].text:
-            self.o_toks = self.o_toks[:-1]
-            self.c_toks = self.c_toks[:-1]
+        while self.o_start < self.o_end and self.c_start < self.c_end and \
+                o_text[self.o_end-1] == c_text[self.c_end-1]:
             self.o_end -= 1
             self.c_end -= 1
-        # Update the strings
-        self.o_str = self.o_toks.text if self.o_toks else ""
-        self.c_str = self.c_toks.text if self.c_toks else ""
+        # Update the tokens and strings on next use
+        self._o_toks = None
+        self._c_toks = None
+        self._o_str = None
+        self._c_str = None
         return self
 
     # Input: An id for the annotator
     # Output: An edit string formatted for an M2 file
     def to_m2(self, id=0):
         span = " ".join(["A", str(self.o_start), str(self.o_end)])
-        cor_toks_str = " ".join([tok.text for tok in self.c_toks])
+        # Only create the cor tokens if they were replaced
+        if self._c_toks is None:
+            cor_toks_str = " ".join(
+                get_features(self.cor).text[self.c_start:self.c_end])
+        else:
+            cor_toks_str = " ".join([tok.text for tok in self._c_toks])
         return "|||".join([span, self.type, cor_toks_str, "REQUIRED", "-NONE-", str(id)])
 
     # Edit object string representation
@@ -53,4 +112,4 @@ class Edit:
         orig = "Orig: "+str([self.o_start, self.o_end, self.o_str])
         cor = "Cor: "+str([self.c_start, self.c_end, self.c_str])
         type = "Type: "+repr(self.type)
-        return ", ".join([orig, cor, type])
\ No newline at end of file
+        return ", ".join([orig, cor, type])
@@ -1,13 +1,83 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+import mmap
 from pathlib import Path
 from rapidfuzz.distance import Levenshtein
 from errant.en.lancaster import LancasterStemmer
-import spacy
+from errant.features import get_features
 import spacy.symbols as POS
 
+# A Hunspell word list that is memory-mapped and searched with binary search
+# The file must contain one word per line in bytewise (LC_ALL=C) sorted order.
+# The operating system shares the mapped file between all processes, so it
+# does not need to be read into a Python set in every process. The file is
+# split into blocks of lines, and only the first word of each block is kept
+# in memory: a lookup finds the block with a binary search over these words
+# and then searches the lines of the block in one step.
+class WordList:
+
+    # Input 1: The path of the sorted word list file
+    # Input 2: The number of bytes per block; the blocks end at line breaks
+    # Input 3: The max number of lookups to memoize; None means no limit
+    def __init__(self, path, block_size=256, cache_size=10000):
+        with open(path, "rb") as word_list:
+            self.data = mmap.mmap(word_list.fileno(), 0, access=mmap.ACCESS_READ)
+        # The line break of the file
+        end = self.data.find(b"\n")
+        self.newline = b"\r\n" if end > 0 and self.data[end-1] == ord("\r") else b"\n"
+        # The last word if the file does not end with a line break
+        self.last_word = None
+        if self.data[-len(self.newline):] != self.newline:
+            self.last_word = self.data[self.data.rfind(b"\n")+1:]
+        self.starts, self.firsts = self.get_blocks(block_size)
+        self.lookup = lru_cache(maxsize=cache_size)(self.find)
+
+    # Input: The number of bytes per block
+    # Output 1: The start offset of each block, followed by the file size
+    # Output 2: The first word of each block
+    def get_blocks(self, block_size):
+        data = self.data
+        starts = []
+        firsts = []
+        start = 0
+        while start < len(data):
+            end = data.find(b"\n", start)
+            if end == -1: end = len(data)
+            starts.append(start)
+            firsts.append(data[start:end].rstrip(b"\r"))
+            # The next block starts at the first line after block_size bytes
+            start = data.find(b"\n", start+block_size)+1
+            if start == 0: break
+        starts.append(len(data))
+        return starts, firsts
+
+    # Input: A word string
+    # Output: Boolean; the word is in the word list
+    def __contains__(self, word):
+        return self.lookup(word)
+
+    # Same as __contains__, but not memoized
+    def find(self, word):
+        word = word.encode("utf8")
+        # Words never contain line breaks
+        if not word or b"\n" in word or b"\r" in word: return False
+        # The block whose first word is the last one <= word
+        i = bisect_right(self.firsts, word)-1
+        if i < 0: return False
+        if self.firsts[i] == word or word == self.last_word: return True
+        # Search the other lines of the block, which all follow a line break
+        # inside the block
+        line = self.newline+word+self.newline
+        return self.data.find(line, self.starts[i], self.starts[i+1]) != -1
+
+    # Output: The hits, misses, maxsize and currsize of the lookup cache
+    def cache_info(self):
+        return self.lookup.cache_info()
+
 # Load Hunspell word list
 def load_word_list(path):
-    with open(path) as word_list:
-        return set([word.strip() for word in word_list])
+    return WordList(path)
 
 # Load Universal Dependency POS Tags map file.
 # https://universaldependencies.org/tagset-conversion/en-penn-uposf.html
@@ -36,16 +106,129 @@ def load_pos_map(path):
         map_dict["XX"] = "X"
     return map_dict
 
+# Input: A spacy Doc
+# Runs the pipeline components that were skipped in a lazily parsed Doc
+# See Annotator.set_lazy_deps.
+def parse_deps(doc):
+    pipes = doc.user_data.pop("lazy_deps", [])
+    for pipe in pipes:
+        pipe(doc)
+    if pipes: get_features(doc).update_deps(doc)
+
+# The dependency labels of a range of tokens in a Doc. The Doc is only
+# dependency parsed when the labels are first used, so it can be used like
+# the list of labels.
+class DepList:
+
+    # Input 1: A spacy Doc
+    # Input 2: The start token offset
+    # Input 3: The end token offset
+    def __init__(self, doc, start, end):
+        self.doc = doc
+        self.start = start
+        self.end = end
+        self.deps = None
+
+    # Output: The list of dep labels
+    def get(self):
+        if self.deps is None:
+            parse_deps(self.doc)
+            self.deps = get_doc_info(self.doc)[1][self.start:self.end]
+        return self.deps
+
+    def __getitem__(self, i): return self.get()[i]
+    def __iter__(self): return iter(self.get())
+    def __len__(self): return self.end-self.start
+    def __eq__(self, other): return self.get() == list(other)
+    def __add__(self, other): return self.get()+list(other)
+    def __radd__(self, other): return list(other)+self.get()
+
+# Input: A spacy Doc
+# Output: A list of the pos tags and a list of the dep tags of all the tokens
+# The lists are only built once per Doc and are kept in its Features. The dep
+# tags are None if the Doc has not been dependency parsed yet. The pos tag is
+# None for tags that are not in the pos map.
+def get_doc_info(doc):
+    features = get_features(doc)
+    strings = doc.vocab.strings
+    if features.mapped_pos is None:
+        # Map each distinct tag only once
+        tag_map = {tag: pos_map.get(strings[tag]) for tag in set(features.tag)}
+        features.mapped_pos = [tag_map[tag] for tag in features.tag]
+    if features.dep_ is None and "lazy_deps" not in doc.user_data:
+        features.dep_ = [strings[dep] for dep in features.dep]
+    return features.mapped_pos, features.dep_
+
+# Input: Spacy tokens
+# Output 1: Their Doc
+# Output 2: The offset of the first token in the Doc
+# Output 3: The offset after the last token in the Doc
+def get_offsets(toks):
+    return toks[0].doc, toks[0].i, toks[-1].i+1
+
+# An LRU cache of error types keyed by edit signatures (see get_edit_key)
+class EditCache:
+
+    # Input: The max number of edit signatures to keep
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        # The error type of each edit signature, or a dict of the error types
+        # for each preceded_by_aux result, in least recently used order
+        self.types = OrderedDict()
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    # Input: An edit signature
+    # Output: The cached error type, the dict of error types, or None
+    def get(self, key):
+        entry = self.types.get(key)
+        if entry is not None: self.types.move_to_end(key)
+        return entry
+
+    # Input 1: An edit signature
+    # Input 2: An error type string or a dict of error types
+    # Stores the entry and evicts the least recently used signatures
+    def put(self, key, entry):
+        self.types[key] = entry
+        self.types.move_to_end(key)
+        while len(self.types) > self.maxsize:
+            self.types.popitem(last=False)
+
+    # Output: A dict of the cache statistics
+    def info(self):
+        lookups = self.hits+self.misses
+        return {"hits": self.hits, "misses": self.misses,
+            "size": len(self.types),
+            "hit_rate": self.hits/lookups if lookups else 0.0}
+
+# Load the stemmer, word list and pos map
+# They are only loaded when the first edit is classified (or when they are
+# first accessed from outside the module), so importing the classifier is fast.
+def load_resources():
+    global stemmer, spell, pos_map, resources_loaded
+    # Lancaster Stemmer
+    stemmer = LancasterStemmer()
+    # GB English word list (inc -ise and -ize)
+    spell = load_word_list(base_dir/"resources"/"en_GB-large.txt")
+    # Part of speech map file
+    pos_map = load_pos_map(base_dir/"resources"/"en-ptb_map")
+    resources_loaded = True
+
+# Input: A module attribute name
+# Output: The stemmer, word list or pos map, which are loaded on first use
+def __getattr__(name):
+    if name in {"stemmer", "spell", "pos_map"}:
+        load_resources()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Classifier resources
 base_dir = Path(__file__).resolve().parent
 # Spacy
 nlp = None
-# Lancaster Stemmer
-stemmer = LancasterStemmer()
-# GB English word list (inc -ise and -ize)
-spell = load_word_list(base_dir/"resources"/"en_GB-large.txt")
-# Part of speech map file
-pos_map = load_pos_map(base_dir/"resources"/"en-ptb_map")
+# The stemmer, word list and pos map are not loaded yet
+resources_loaded = False
 # Open class coarse Spacy POS tags 
 open_pos1 = {POS.ADJ, POS.ADV, POS.NOUN, POS.VERB}
 # Open class coarse Spacy POS tags (strings)
@@ -66,9 +249,75 @@ dep_map = {
     "prt": "PART",
     "punct": "PUNCT"}
 
+# Input 1: A list of Edit objects
+# Input 2: An EditCache of error types (default: no cache)
+# Output: The same Edit objects with updated error types
+# The pos and dep tags of each Doc are extracted once for all its edits.
+def classify_batch(edits, cache=None):
+    # Load the classifier resources on first use
+    if not resources_loaded: load_resources()
+    for edit in edits:
+        for toks in (edit.o_toks, edit.c_toks):
+            if toks: get_doc_info(toks[0].doc)
+    return [classify(edit, cache) for edit in edits]
+
+# Input 1: An Edit object
+# Input 2: An EditCache of error types (default: no cache)
+# Output: The same Edit object with an updated error type
+def classify(edit, cache=None):
+    # Load the classifier resources on first use
+    if not resources_loaded: load_resources()
+    if cache is None: return classify_edit(edit)
+    # Look up the error type of the edit signature
+    key = get_edit_key(edit)
+    entry = cache.get(key)
+    # The type also depends on whether the verbs are preceded by aux
+    if isinstance(entry, dict):
+        entry = entry.get(preceded_by_aux(edit.o_toks, edit.c_toks))
+    if entry is not None:
+        cache.hits += 1
+        edit.type = entry
+        return edit
+    cache.misses += 1
+    # The preceded_by_aux results that the classification depends on
+    aux_results = []
+    edit = classify_edit(edit, aux_results)
+    # The key includes the dep tags if the classifier parsed the Docs
+    key = get_edit_key(edit)
+    if aux_results:
+        entry = cache.get(key) or {}
+        entry[aux_results[0]] = edit.type
+        cache.put(key, entry)
+    else:
+        cache.put(key, edit.type)
+    return edit
+
 # Input: An Edit object
+# Output: The signature of the edit; the orig and cor strings and the text,
+# tag, pos, lemma and dep of each token
+# The classifier only reads these token attributes, and the dep tags and
+# syntactic context of preceded_by_aux only once the Docs are dependency
+# parsed. The dep tags are therefore left out for a Doc that is not parsed
+# yet: an edit that was classified without parsing it never depends on them.
+def get_edit_key(edit):
+    return edit.o_str, edit.c_str, get_toks_key(edit.o_toks), \
+        get_toks_key(edit.c_toks)
+
+# Input: Spacy tokens
+# Output: A tuple of the attributes of each token that the classifier reads
+def get_toks_key(toks):
+    if not toks: return ()
+    doc, start, end = get_offsets(toks)
+    features = get_features(doc)
+    if "lazy_deps" in doc.user_data: deps = [None]*(end-start)
+    else: deps = features.dep[start:end]
+    return tuple(zip(features.text[start:end], features.tag[start:end],
+        features.pos[start:end], features.lemma[start:end], deps))
+
+# Input 1: An Edit object
+# Input 2: A list to append any preceded_by_aux results to (default: None)
 # Output: The same Edit object with an updated error type
-def classify(edit):
+def classify_edit(edit, aux_results=None):
     # Nothing to nothing is a detected but not corrected edit
     if not edit.o_toks and not edit.c_toks:
         edit.type = "UNK"
@@ -99,26 +348,29 @@ def classify(edit):
             edit.o_toks = edit.o_toks[:-1]
             edit.c_toks = edit.c_toks[:-1]
             # Classify the truncated edit
-            edit = classify(edit)
+            edit = classify_edit(edit, aux_results)
             # Restore the full orig and cor toks
             edit.o_toks = all_o_toks
             edit.c_toks = all_c_toks
         # Replacement
         else:
             op = "R:"
-            cat = get_two_sided_type(edit.o_toks, edit.c_toks)
+            cat = get_two_sided_type(edit.o_toks, edit.c_toks, aux_results)
             edit.type = op+cat
     return edit
 
 # Input: Spacy tokens
 # Output: A list of pos and dep tag strings
+# The dep tags are a DepList if the Doc has not been dependency parsed yet.
 def get_edit_info(toks):
-    pos = []
-    dep = []
-    for tok in toks:
-        pos.append(pos_map[tok.tag_])
-        dep.append(tok.dep_)
-    return pos, dep
+    if not toks: return [], []
+    doc, start, end = get_offsets(toks)
+    pos, dep = get_doc_info(doc)
+    pos = pos[start:end]
+    # Raise the KeyError of tags that are not in the pos map
+    if None in pos: pos_map[toks[pos.index(None)].tag_]
+    if dep is None: return pos, DepList(doc, start, end)
+    return pos, dep[start:end]
 
 # Input: Spacy tokens
 # Output: An error type string based on input tokens from orig or cor
@@ -133,9 +385,10 @@ def get_one_sided_type(toks):
         if toks[0].lower_ in conts:
             return "CONTR"
         # Infinitival "to" is treated as part of a verb form
-        if toks[0].lower_ == "to" and toks[0].pos == POS.PART and \
-                toks[0].dep_ != "prep":
-            return "VERB:FORM"
+        if toks[0].lower_ == "to" and toks[0].pos == POS.PART:
+            parse_deps(toks[0].doc)
+            if toks[0].dep_ != "prep":
+                return "VERB:FORM"
     # Extract pos tags and parse info from the toks
     pos_list, dep_list = get_edit_info(toks)
     # Auxiliary verbs
@@ -156,8 +409,9 @@ def get_one_sided_type(toks):
 
 # Input 1: Spacy orig tokens
 # Input 2: Spacy cor tokens
+# Input 3: A list to append any preceded_by_aux results to (default: None)
 # Output: An error type string based on orig AND cor
-def get_two_sided_type(o_toks, c_toks):
+def get_two_sided_type(o_toks, c_toks, aux_results=None):
     # Extract pos tags and parse info from the toks as lists
     o_pos, o_dep = get_edit_info(o_toks)
     c_pos, c_dep = get_edit_info(c_toks)
@@ -251,7 +505,9 @@ def get_two_sided_type(o_toks, c_toks):
                     # NOTE: These rules are carefully ordered.
                     # Use the dep parse to find some form errors.
                     # Main verbs preceded by aux cannot be tense or SVA.
-                    if preceded_by_aux(o_toks, c_toks):
+                    aux = preceded_by_aux(o_toks, c_toks)
+                    if aux_results is not None: aux_results.append(aux)
+                    if aux:
                         return "VERB:FORM"
                     # Use fine PTB tags to find various errors.
                     # FORM errors normally involve VBG or VBN.
@@ -475,6 +731,9 @@ def exact_reordering(o_toks, c_toks):
 # Input 2: A corrected text spacy token.
 # Output: Boolean; both tokens have a dependant auxiliary verb.
 def preceded_by_aux(o_tok, c_tok):
+    # Make sure both Docs are dependency parsed
+    parse_deps(o_tok[0].doc)
+    parse_deps(c_tok[0].doc)
     # If the toks are aux, we need to check if they are the first aux.
     if o_tok[0].dep_.startswith("aux") and c_tok[0].dep_.startswith("aux"):
         # Find the parent verb
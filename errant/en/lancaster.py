@@ -12,6 +12,7 @@
 A word stemmer based on the Lancaster (Paice/Husk) stemming algorithm.
 Paice, Chris D. "Another Stemmer." ACM SIGIR Forum 24.3 (1990): 56-61.
 """
+from functools import lru_cache
 import re
 
 class LancasterStemmer:
@@ -48,6 +49,8 @@ class LancasterStemmer:
         >>> st_custom = LancasterStemmer(rule_tuple=("ssen4>", "s1t."))
         >>> st_custom.stem("ness") # Change s to t
         'nest'
+        >>> st.cache_info().hits     # Stems are memoized per stemmer
+        0
     """
 
     # The rule list is static since it doesn't change between instances
@@ -169,15 +172,34 @@ class LancasterStemmer:
         "zy1s.",  # -yz > -ys
     )
 
-    def __init__(self, rule_tuple=None, strip_prefix_flag=False):
+    def __init__(self, rule_tuple=None, strip_prefix_flag=False, cache_size=100000):
         """Create an instance of the Lancaster stemmer.
+
+        The stems of the last cache_size distinct words are memoized.
         """
         # Setup an empty rule dictionary - this will be filled in later
         self.rule_dictionary = {}
+        # The rules of each last letter as tuples of the reversed ending, the
+        # intact flag, the number of chars to remove, the string to append
+        # and whether stemming stops after the rule
+        self.compiled_rules = {}
         # Check if a user wants to strip prefix
         self._strip_prefix = strip_prefix_flag
         # Check if a user wants to use his/her own rule tuples.
         self._rule_tuple = rule_tuple if rule_tuple else self.default_rule_tuple
+        self.set_cache_size(cache_size)
+
+    def set_cache_size(self, cache_size):
+        """Memoize the stems of the last cache_size distinct words.
+
+        Replaces any previous cache; None means no limit.
+        """
+        self._cached_stem = lru_cache(maxsize=cache_size)(self.__stem)
+
+    def cache_info(self):
+        """Return the hits, misses, maxsize and currsize of the stem cache.
+        """
+        return self._cached_stem.cache_info()
 
     def parseRules(self, rule_tuple=None):
         """Validate the set of rules used in this stemmer.
@@ -189,9 +211,10 @@ class LancasterStemmer:
         """
         # If there is no argument for the function, use class' own rule tuple.
         rule_tuple = rule_tuple if rule_tuple else self._rule_tuple
-        valid_rule = re.compile(r"^[a-z]+\*?\d[a-z]*[>\.]?$")
+        valid_rule = re.compile(r"^([a-z]+)(\*?)(\d)([a-z]*)([>\.]?)$")
         # Empty any old rules from the rule set before adding new ones
         self.rule_dictionary = {}
+        self.compiled_rules = {}
 
         for rule in rule_tuple:
             if not valid_rule.match(rule):
@@ -202,9 +225,39 @@ class LancasterStemmer:
             else:
                 self.rule_dictionary[first_letter] = [rule]
 
+        # Precompile the rules so they are only parsed once
+        for first_letter, rules in self.rule_dictionary.items():
+            self.compiled_rules[first_letter] = []
+            for rule in rules:
+                (
+                    ending_string,
+                    intact_flag,
+                    remove_total,
+                    append_string,
+                    cont_flag,
+                ) = valid_rule.match(rule).groups()
+                self.compiled_rules[first_letter].append((
+                    ending_string[::-1],
+                    bool(intact_flag),
+                    int(remove_total),
+                    append_string,
+                    cont_flag == ".",
+                ))
+        # Forget the stems of the old rules
+        self._cached_stem.cache_clear()
+
     def stem(self, word):
         """Stem a word using the Lancaster stemmer.
         """
+        # If rule dictionary is empty, parse rule tuple.
+        if not self.rule_dictionary:
+            self.parseRules()
+
+        return self._cached_stem(word)
+
+    def __stem(self, word):
+        """Stem a word that is not in the cache.
+        """
         # Lower-case the word, since all the rules are lower-cased
         word = word.lower()
         word = self.__stripPrefix(word) if self._strip_prefix else word
@@ -212,21 +265,14 @@ class LancasterStemmer:
         # Save a copy of the original word
         intact_word = word
 
-        # If rule dictionary is empty, parse rule tuple.
-        if not self.rule_dictionary:
-            self.parseRules()
-
         return self.__doStemming(word, intact_word)
 
     def __doStemming(self, word, intact_word):
         """Perform the actual word stemming
         """
+        compiled_rules = self.compiled_rules
 
-        valid_rule = re.compile(r"^([a-z]+)(\*?)(\d)([a-z]*)([>\.]?)$")
-
-        proceed = True
-
-        while proceed:
+        while True:
 
             # Find the position of the last letter of the word to be stemmed
             last_letter_position = self.__getLastLetter(word)
@@ -234,53 +280,33 @@ class LancasterStemmer:
             # Only stem the word if it has a last letter and a rule matching that last letter
             if (
                 last_letter_position < 0
-                or word[last_letter_position] not in self.rule_dictionary
+                or word[last_letter_position] not in compiled_rules
             ):
-                proceed = False
+                break
 
+            # Go through each rule that matches the word's final letter
+            for (
+                ending_string,
+                intact_flag,
+                remove_total,
+                append_string,
+                stop,
+            ) in compiled_rules[word[last_letter_position]]:
+                # Apply the first rule whose ending matches the word's ending
+                # (if the word must be intact, it is) and that leaves an
+                # acceptable stem
+                if (
+                    word.endswith(ending_string)
+                    and (not intact_flag or word == intact_word)
+                    and self.__isAcceptable(word, remove_total)
+                ):
+                    word = self.__applyRule(word, remove_total, append_string)
+                    break
+            # If no rules apply, the word doesn't need any more stemming
             else:
-                rule_was_applied = False
-
-                # Go through each rule that matches the word's final letter
-                for rule in self.rule_dictionary[word[last_letter_position]]:
-                    rule_match = valid_rule.match(rule)
-                    if rule_match:
-                        (
-                            ending_string,
-                            intact_flag,
-                            remove_total,
-                            append_string,
-                            cont_flag,
-                        ) = rule_match.groups()
-
-                        # Convert the number of chars to remove when stemming
-                        # from a string to an integer
-                        remove_total = int(remove_total)
-
-                        # Proceed if word's ending matches rule's word ending
-                        if word.endswith(ending_string[::-1]):
-                            if intact_flag:
-                                if word == intact_word and self.__isAcceptable(
-                                    word, remove_total
-                                ):
-                                    word = self.__applyRule(
-                                        word, remove_total, append_string
-                                    )
-                                    rule_was_applied = True
-                                    if cont_flag == ".":
-                                        proceed = False
-                                    break
-                            elif self.__isAcceptable(word, remove_total):
-                                word = self.__applyRule(
-                                    word, remove_total, append_string
-                                )
-                                rule_was_applied = True
-                                if cont_flag == ".":
-                                    proceed = False
-                                break
-                # If no rules apply, the word doesn't need any more stemming
-                if rule_was_applied == False:
-                    proceed = False
+                break
+            if stop:
+                break
         return word
 
     def __getLastLetter(self, word):
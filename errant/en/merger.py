@@ -1,12 +1,15 @@
-from itertools import combinations, groupby
+from itertools import groupby
 from re import sub
 from string import punctuation
 from rapidfuzz.distance import Indel
 import spacy.symbols as POS
+from spacy.strings import get_string_id
 from errant.edit import Edit
 
 # Merger resources
 open_pos = {POS.ADJ, POS.AUX, POS.ADV, POS.NOUN, POS.VERB}
+# The tag id of possessive suffixes
+poss_tag = get_string_id("POS")
 
 # Input: An Alignment object
 # Output: A list of Edit objects
@@ -33,91 +36,143 @@ def get_rule_edits(alignment):
 # Input 1: A sequence of adjacent D, I and/or S alignments
 # Input 2: An Alignment object
 # Output: A sequence of merged/split alignments
+# The rules are applied to the subsequences seq[lo:hi] recursively. The result
+# of each subsequence and the features of each range seq[start:end+1] are
+# only computed once, so long runs of non-matches take polynomial time.
 def process_seq(seq, alignment):
-    # Return single alignments
-    if len(seq) <= 1: return seq
     # Get the ops for the whole sequence
     ops = [op[0] for op in seq]
-    # Merge all D xor I ops. (95% of human multi-token edits contain S).
-    if set(ops) == {"D"} or set(ops) == {"I"}: return merge_edits(seq)
+    # The number of S ops before each position
+    s_counts = [0]
+    for op in ops: s_counts.append(s_counts[-1]+(op == "S"))
+    # The token features of orig and cor
+    o_feats = alignment.o_feats
+    c_feats = alignment.c_feats
+    # Results of subsequences and features of ranges
+    results = {}
+    strs = {}
+    pos_sets = {}
 
-    content = False # True if edit includes a content word
-    # Get indices of all start-end combinations in the seq: 012 = 01, 02, 12
-    combos = list(combinations(range(0, len(seq)), 2))
-    # Sort them starting with largest spans first
-    combos.sort(key = lambda x: x[1]-x[0], reverse=True)
-    # Loop through combos
-    for start, end in combos:
-        # Ignore ranges that do NOT contain a substitution.
-        if "S" not in ops[start:end+1]: continue
-        # Get the tokens in orig and cor. They will now never be empty.
-        o = alignment.orig[seq[start][1]:seq[end][2]]
-        c = alignment.cor[seq[start][3]:seq[end][4]]
-        # First token possessive suffixes
-        if start == 0 and (o[0].tag_ == "POS" or c[0].tag_ == "POS"):
-            return [seq[0]] + process_seq(seq[1:], alignment)
-        # Merge possessive suffixes: [friends -> friend 's]
-        if o[-1].tag_ == "POS" or c[-1].tag_ == "POS":
-            return process_seq(seq[:end-1], alignment) + \
-                merge_edits(seq[end-1:end+1]) + \
-                process_seq(seq[end+1:], alignment)
-        # Case changes
-        if o[-1].lower == c[-1].lower:
-            # Merge first token I or D: [Cat -> The big cat]
-            if start == 0 and ((len(o) == 1 and c[0].text[0].isupper()) or \
-                    (len(c) == 1 and o[0].text[0].isupper())):
-                return merge_edits(seq[start:end+1]) + \
-                    process_seq(seq[end+1:], alignment)
-            # Merge with previous punctuation: [, we -> . We], [we -> . We]
-            if (len(o) > 1 and is_punct(o[-2])) or \
-                    (len(c) > 1 and is_punct(c[-2])):
-                return process_seq(seq[:end-1], alignment) + \
-                    merge_edits(seq[end-1:end+1]) + \
-                    process_seq(seq[end+1:], alignment)
-        # Merge whitespace/hyphens: [acat -> a cat], [sub - way -> subway]
-        s_str = sub("['-]", "", "".join([tok.lower_ for tok in o]))
-        t_str = sub("['-]", "", "".join([tok.lower_ for tok in c]))
-        if s_str == t_str:
-            return process_seq(seq[:start], alignment) + \
-                merge_edits(seq[start:end+1]) + \
-                process_seq(seq[end+1:], alignment)
-        # Merge same POS or auxiliary/infinitive/phrasal verbs:
-        # [to eat -> eating], [watch -> look at]
-        pos_set = set([tok.pos for tok in o]+[tok.pos for tok in c])
-        if len(o) != len(c) and (len(pos_set) == 1 or \
-                pos_set.issubset({POS.AUX, POS.PART, POS.VERB})):
-            return process_seq(seq[:start], alignment) + \
-                merge_edits(seq[start:end+1]) + \
-                process_seq(seq[end+1:], alignment)
-        # Split rules take effect when we get to smallest chunks
-        if end-start < 2:
-            # Split adjacent substitutions
-            if len(o) == len(c) == 2:
-                return process_seq(seq[:start+1], alignment) + \
-                    process_seq(seq[start+1:], alignment)
-            # Split similar substitutions at sequence boundaries
-            if (ops[start] == "S" and char_cost(o[0], c[0]) > 0.75) or \
-                    (ops[end] == "S" and char_cost(o[-1], c[-1]) > 0.75):
-                return process_seq(seq[:start+1], alignment) + \
-                    process_seq(seq[start+1:], alignment)
-            # Split final determiners
-            if end == len(seq)-1 and ((ops[-1] in {"D", "S"} and \
-                    o[-1].pos == POS.DET) or (ops[-1] in {"I", "S"} and \
-                    c[-1].pos == POS.DET)):
-                return process_seq(seq[:-1], alignment) + [seq[-1]]
-        # Set content word flag
-        if not pos_set.isdisjoint(open_pos): content = True
-    # Merge sequences that contain content words
-    if content: return merge_edits(seq)
-    else: return seq
+    # Input 1: A features table
+    # Input 2: A token start offset
+    # Input 3: A token end offset
+    # Output: The lower case string of the tokens without apostrophes/hyphens
+    def get_str(features, start, end):
+        key = (features is o_feats, start, end)
+        if key not in strs:
+            strs[key] = sub("['-]", "", "".join(features.lower_[start:end]))
+        return strs[key]
 
-# Check whether token is punctuation
-def is_punct(token):
-    return token.pos == POS.PUNCT or token.text in punctuation
+    # Input 1: A start index in seq
+    # Input 2: An end index in seq
+    # Output: The set of orig and cor pos ids in seq[start:end+1]
+    def get_pos_set(start, end):
+        key = (start, end)
+        if key not in pos_sets:
+            pos_sets[key] = set(o_feats.pos[seq[start][1]:seq[end][2]]+
+                c_feats.pos[seq[start][3]:seq[end][4]])
+        return pos_sets[key]
 
-# Calculate the cost of character alignment; i.e. char similarity
+    # Input 1: The start index of a subsequence of seq
+    # Input 2: The end index of a subsequence of seq
+    # Output: The merged/split alignments of seq[lo:hi]
+    def process(lo, hi):
+        if (lo, hi) not in results:
+            results[lo, hi] = process_range(lo, hi)
+        return results[lo, hi]
+
+    def process_range(lo, hi):
+        # Return single alignments
+        if hi-lo <= 1: return seq[lo:hi]
+        # Merge all D xor I ops. (95% of human multi-token edits contain S).
+        if set(ops[lo:hi]) == {"D"} or set(ops[lo:hi]) == {"I"}:
+            return merge_edits(seq[lo:hi])
+
+        content = False # True if edit includes a content word
+        # Loop through all start-end combinations in the seq, starting with
+        # the largest spans: 012 = 02, 01, 12
+        for size in range(hi-lo-1, 0, -1):
+            for start in range(lo, hi-size):
+                end = start+size
+                # Ignore ranges that do NOT contain a substitution.
+                if s_counts[end+1] == s_counts[start]: continue
+                # Get the token offsets in orig and cor. The tokens will now
+                # never be empty.
+                o_start, o_end = seq[start][1], seq[end][2]
+                c_start, c_end = seq[start][3], seq[end][4]
+                o_len = o_end-o_start
+                c_len = c_end-c_start
+                # First token possessive suffixes
+                if start == lo and (o_feats.tag[o_start] == poss_tag or \
+                        c_feats.tag[c_start] == poss_tag):
+                    return [seq[lo]] + process(lo+1, hi)
+                # Merge possessive suffixes: [friends -> friend 's]
+                if o_feats.tag[o_end-1] == poss_tag or \
+                        c_feats.tag[c_end-1] == poss_tag:
+                    return process(lo, end-1) + \
+                        merge_edits(seq[end-1:end+1]) + \
+                        process(end+1, hi)
+                # Case changes
+                if o_feats.lower[o_end-1] == c_feats.lower[c_end-1]:
+                    # Merge first token I or D: [Cat -> The big cat]
+                    if start == lo and \
+                            ((o_len == 1 and c_feats.text[c_start][0].isupper()) or \
+                            (c_len == 1 and o_feats.text[o_start][0].isupper())):
+                        return merge_edits(seq[start:end+1]) + \
+                            process(end+1, hi)
+                    # Merge with previous punctuation: [, we -> . We], [we -> . We]
+                    if (o_len > 1 and is_punct(o_feats, o_end-2)) or \
+                            (c_len > 1 and is_punct(c_feats, c_end-2)):
+                        return process(lo, end-1) + \
+                            merge_edits(seq[end-1:end+1]) + \
+                            process(end+1, hi)
+                # Merge whitespace/hyphens: [acat -> a cat], [sub - way -> subway]
+                if get_str(o_feats, o_start, o_end) == \
+                        get_str(c_feats, c_start, c_end):
+                    return process(lo, start) + \
+                        merge_edits(seq[start:end+1]) + \
+                        process(end+1, hi)
+                # Merge same POS or auxiliary/infinitive/phrasal verbs:
+                # [to eat -> eating], [watch -> look at]
+                pos_set = get_pos_set(start, end)
+                if o_len != c_len and (len(pos_set) == 1 or \
+                        pos_set.issubset({POS.AUX, POS.PART, POS.VERB})):
+                    return process(lo, start) + \
+                        merge_edits(seq[start:end+1]) + \
+                        process(end+1, hi)
+                # Split rules take effect when we get to smallest chunks
+                if end-start < 2:
+                    # Split adjacent substitutions
+                    if o_len == c_len == 2:
+                        return process(lo, start+1) + process(start+1, hi)
+                    # Split similar substitutions at sequence boundaries
+                    if (ops[start] == "S" and char_cost(o_feats.text[o_start],
+                            c_feats.text[c_start]) > 0.75) or \
+                            (ops[end] == "S" and char_cost(o_feats.text[o_end-1],
+                            c_feats.text[c_end-1]) > 0.75):
+                        return process(lo, start+1) + process(start+1, hi)
+                    # Split final determiners
+                    if end == hi-1 and ((ops[end] in {"D", "S"} and \
+                            o_feats.pos[o_end-1] == POS.DET) or \
+                            (ops[end] in {"I", "S"} and \
+                            c_feats.pos[c_end-1] == POS.DET)):
+                        return process(lo, hi-1) + [seq[hi-1]]
+                # Set content word flag
+                if not pos_set.isdisjoint(open_pos): content = True
+        # Merge sequences that contain content words
+        if content: return merge_edits(seq[lo:hi])
+        else: return seq[lo:hi]
+
+    return process(0, len(seq))
+
+# Check whether token i in a Features table is punctuation
+def is_punct(features, i):
+    return features.pos[i] == POS.PUNCT or features.text[i] in punctuation
+
+# Calculate the cost of character alignment of two token strings; i.e. char
+# similarity
 def char_cost(a, b):
-    return 1-Indel.normalized_distance(a.text, b.text)
+    return 1-Indel.normalized_distance(a, b)
     
 # Merge the input alignment sequence to a single edit span
 def merge_edits(seq):
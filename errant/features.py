@@ -0,0 +1,68 @@
+from weakref import WeakKeyDictionary
+from spacy.tokens import Span
+
+# The token attributes that the alignment, merger and classifier read,
+# extracted once per spacy Doc. Reading them from spacy tokens again and again
+# is much slower than reading them from lists.
+class Features:
+
+    # Input: A spacy Doc, or None for an empty table
+    def __init__(self, doc=None):
+        # Integer ids: the spacy hashes of the orth, lower, lemma, tag and dep
+        # strings and the UD pos id, as in token.orth, token.lower etc.
+        self.orth = []
+        self.lower = []
+        self.lemma = []
+        self.pos = []
+        self.tag = []
+        self.dep = []
+        # Strings
+        self.text = []
+        self.lower_ = []
+        # The (lower, lemma, pos, text) key of each token for the alignment
+        # substitution costs; see alignment.get_feature_sub_cost
+        self.sub_key = []
+        # Columns that a stage derives from the others on first use, e.g. the
+        # classifier's mapped pos tags and dep label strings; None until then
+        self.mapped_pos = None
+        self.dep_ = None
+        if doc is not None and len(doc):
+            self.orth, self.lower, self.lemma, self.pos, self.tag, self.dep, \
+                self.text, self.lower_ = map(list, zip(*[(tok.orth, tok.lower,
+                tok.lemma, tok.pos, tok.tag, tok.dep, tok.text, tok.lower_)
+                for tok in doc]))
+            self.sub_key = list(zip(self.lower, self.lemma, self.pos, self.text))
+
+    # Input: A slice of token offsets
+    # Output: A new Features table of those tokens
+    def __getitem__(self, key):
+        features = Features()
+        for name, values in vars(self).items():
+            if values is not None: setattr(features, name, values[key])
+        return features
+
+    def __len__(self):
+        return len(self.orth)
+
+    # Input: A spacy Doc
+    # Rereads the dep ids after the Doc was dependency parsed
+    def update_deps(self, doc):
+        self.dep = [tok.dep for tok in doc]
+        self.dep_ = None
+
+# The Features table of each Doc; a table is dropped with its Doc. They are
+# not kept in doc.user_data, which spacy serializes with the Doc.
+doc_features = WeakKeyDictionary()
+
+# Input: A spacy Doc or Span
+# Output: The Features of its tokens
+# The table of each Doc is only built once, so the Doc should not be modified
+# afterwards. Spans get a slice of the Doc table.
+def get_features(toks):
+    doc = toks.doc
+    features = doc_features.get(doc)
+    if features is None:
+        features = Features(doc)
+        doc_features[doc] = features
+    if isinstance(toks, Span): return features[toks.start:toks.end]
+    return features
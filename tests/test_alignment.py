@@ -0,0 +1,278 @@
+import random
+import unittest
+import spacy
+from spacy.tokens import Doc
+from rapidfuzz.distance import Indel
+from errant.alignment import Alignment
+
+# Words with their lemmas and POS tags. Several words share a lemma, POS tag
+# or lower case form, so that the substitution costs often tie.
+WORDS = [
+    ("the", "the", "DET"), ("The", "the", "DET"), ("a", "a", "DET"),
+    ("cat", "cat", "NOUN"), ("cats", "cat", "NOUN"), ("Cat", "cat", "NOUN"),
+    ("sat", "sit", "VERB"), ("sits", "sit", "VERB"), ("sit", "sit", "VERB"),
+    ("on", "on", "ADP"), ("in", "in", "ADP"), ("mat", "mat", "NOUN"),
+    ("big", "big", "ADJ"), ("bigger", "big", "ADJ"), ("quickly", "quickly", "ADV"),
+    ("is", "be", "AUX"), ("was", "be", "AUX"), ("to", "to", "PART"),
+    (".", ".", "PUNCT"), (",", ",", "PUNCT"), ("and", "and", "CCONJ"),
+]
+
+# Input 1: A random number generator
+# Input 2: A number of tokens
+# Output: A list of random word indices
+def random_words(rng, n):
+    return [rng.randrange(len(WORDS)) for _ in range(n)]
+
+# Input 1: A random number generator
+# Input 2: A list of word indices
+# Output: A copy of the words with random edits and many swapped tokens
+def random_edit(rng, words):
+    words = words[:]
+    for _ in range(rng.randint(0, max(1, len(words)//2))):
+        op = rng.random()
+        i = rng.randrange(len(words)+1)
+        # Swap or shuffle a few tokens
+        if op < 0.4 and len(words) >= 2:
+            i = min(i, len(words)-2)
+            k = rng.randint(2, min(4, len(words)-i))
+            part = words[i:i+k]
+            rng.shuffle(part)
+            words[i:i+k] = part
+        elif op < 0.6: words.insert(i, rng.randrange(len(WORDS)))
+        elif op < 0.8 and words: del words[min(i, len(words)-1)]
+        elif words: words[min(i, len(words)-1)] = rng.randrange(len(WORDS))
+    return words
+
+# Reference implementation: the original ERRANT alignment that fills every
+# cell of the matrices with the spacy tokens
+# Input 1: An orig Doc
+# Input 2: A cor Doc
+# Input 3: A flag for standard Levenshtein alignment
+# Output: The cost matrix, the op matrix and the cheapest align sequence
+def reference_align(orig, cor, lev):
+    o_len = len(orig)
+    c_len = len(cor)
+    o_low = [o.lower for o in orig]
+    c_low = [c.lower for c in cor]
+    cost_matrix = [[0.0 for j in range(c_len+1)] for i in range(o_len+1)]
+    op_matrix = [["O" for j in range(c_len+1)] for i in range(o_len+1)]
+    for i in range(1, o_len+1):
+        cost_matrix[i][0] = cost_matrix[i-1][0] + 1
+        op_matrix[i][0] = "D"
+    for j in range(1, c_len+1):
+        cost_matrix[0][j] = cost_matrix[0][j-1] + 1
+        op_matrix[0][j] = "I"
+    for i in range(o_len):
+        for j in range(c_len):
+            if orig[i].orth == cor[j].orth:
+                cost_matrix[i+1][j+1] = cost_matrix[i][j]
+                op_matrix[i+1][j+1] = "M"
+            else:
+                del_cost = cost_matrix[i][j+1] + 1
+                ins_cost = cost_matrix[i+1][j] + 1
+                trans_cost = float("inf")
+                if lev: sub_cost = cost_matrix[i][j] + 1
+                else:
+                    sub_cost = cost_matrix[i][j] + \
+                        reference_sub_cost(orig[i], cor[j])
+                    k = 1
+                    while i-k >= 0 and j-k >= 0 and \
+                            cost_matrix[i-k+1][j-k+1] != cost_matrix[i-k][j-k]:
+                        if sorted(o_low[i-k:i+1]) == sorted(c_low[j-k:j+1]):
+                            trans_cost = cost_matrix[i-k][j-k] + k
+                            break
+                        k += 1
+                costs = [trans_cost, sub_cost, ins_cost, del_cost]
+                l = costs.index(min(costs))
+                cost_matrix[i+1][j+1] = costs[l]
+                if   l == 0: op_matrix[i+1][j+1] = "T"+str(k+1)
+                elif l == 1: op_matrix[i+1][j+1] = "S"
+                elif l == 2: op_matrix[i+1][j+1] = "I"
+                else: op_matrix[i+1][j+1] = "D"
+    # Backtrace
+    i = o_len
+    j = c_len
+    align_seq = []
+    while i + j != 0:
+        op = op_matrix[i][j]
+        if op in {"M", "S"}:
+            align_seq.append((op, i-1, i, j-1, j))
+            i -= 1
+            j -= 1
+        elif op == "D":
+            align_seq.append((op, i-1, i, j, j))
+            i -= 1
+        elif op == "I":
+            align_seq.append((op, i, i, j-1, j))
+            j -= 1
+        else:
+            k = int(op[1:])
+            align_seq.append((op, i-k, i, j-k, j))
+            i -= k
+            j -= k
+    align_seq.reverse()
+    return cost_matrix, op_matrix, align_seq
+
+# Input 1: A spacy orig Token
+# Input 2: A spacy cor Token
+# Output: The original ERRANT substitution cost
+def reference_sub_cost(o, c):
+    if o.lower == c.lower: return 0
+    lemma_cost = 0 if o.lemma == c.lemma else 0.499
+    if o.pos == c.pos: pos_cost = 0
+    elif o.pos in Alignment._open_pos and c.pos in Alignment._open_pos:
+        pos_cost = 0.25
+    else: pos_cost = 0.5
+    return lemma_cost + pos_cost + Indel.normalized_distance(o.text, c.text)
+
+class TestAlignmentEngines(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.vocab = spacy.blank("en").vocab
+        # Test the vectorized fill and the bands even on matrices that are
+        # too small for them
+        cls.numpy_min_cells = Alignment._numpy_min_cells
+        cls.band_max_fraction = Alignment._band_max_fraction
+        Alignment._numpy_min_cells = 0
+        Alignment._band_max_fraction = 0
+
+    @classmethod
+    def tearDownClass(cls):
+        Alignment._numpy_min_cells = cls.numpy_min_cells
+        Alignment._band_max_fraction = cls.band_max_fraction
+
+    # Input: A list of word indices
+    # Output: A new spacy Doc of the words
+    def make_doc(self, words):
+        return Doc(self.vocab, words=[WORDS[w][0] for w in words],
+            lemmas=[WORDS[w][1] for w in words], pos=[WORDS[w][2] for w in words])
+
+    # Check that every engine gets the same align_seq as the reference, and
+    # that the full matrices are the same too. The document engine is only
+    # exact for standard Levenshtein alignment.
+    def check_pair(self, o_words, c_words):
+        for lev in (False, True):
+            orig = self.make_doc(o_words)
+            cor = self.make_doc(c_words)
+            costs, ops, seq = reference_align(orig, cor, lev)
+            engines = ["python", "numpy", "banded"]
+            if lev: engines.append("document")
+            for engine in engines:
+                for keep_matrices in (True, False):
+                    msg = (engine, lev, keep_matrices, [t.text for t in orig],
+                        [t.text for t in cor])
+                    alignment = Alignment(orig, cor, lev, engine, keep_matrices)
+                    self.assertEqual(alignment.align_seq, seq, msg)
+                    self.assertEqual(alignment.op_matrix, ops, msg)
+                    self.assertEqual(alignment.cost_matrix, costs, msg)
+
+    def test_empty(self):
+        self.check_pair([], [])
+        self.check_pair([3, 6], [])
+        self.check_pair([], [3, 6])
+
+    def test_identical(self):
+        self.check_pair([0, 3, 6, 9, 0, 11, 18], [0, 3, 6, 9, 0, 11, 18])
+
+    def test_case_change(self):
+        self.check_pair([0, 3, 6], [1, 5, 6])
+
+    def test_transpositions(self):
+        # Swaps, a rotation and a reversal of the whole sentence
+        self.check_pair([0, 3, 6, 9, 11], [3, 0, 6, 11, 9])
+        self.check_pair([0, 12, 3, 6, 14], [12, 3, 6, 14, 0])
+        self.check_pair([0, 12, 3, 6, 14, 18], [18, 14, 6, 3, 12, 0])
+        # Repeated tokens
+        self.check_pair([0, 0, 3, 0, 3, 3], [3, 0, 3, 0, 0, 3])
+        self.check_pair([1, 3, 0, 4], [0, 3, 1, 4])
+
+    def test_band_transpositions(self):
+        # Transpositions that start outside the first banded engine band and
+        # decide the op of a cell inside it
+        self.check_pair([12, 12, 7, 7, 0, 15, 9, 17, 9], [9, 15, 7, 9, 12, 17, 12, 0, 7])
+        self.check_pair([7, 6, 9, 9, 20, 6, 20, 6], [6, 6, 7, 20, 6, 9, 9, 20])
+
+    def test_random_short(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            o_words = random_words(rng, rng.randint(0, 8))
+            self.check_pair(o_words, random_edit(rng, o_words))
+
+    def test_random_long(self):
+        rng = random.Random(1)
+        for _ in range(60):
+            o_words = random_words(rng, rng.randint(20, 50))
+            self.check_pair(o_words, random_edit(rng, o_words))
+
+    def test_random_unrelated(self):
+        # Unrelated sentences of different lengths widen the band the most
+        rng = random.Random(2)
+        for _ in range(60):
+            self.check_pair(random_words(rng, rng.randint(0, 15)),
+                random_words(rng, rng.randint(0, 15)))
+
+    def test_random_shuffled(self):
+        # Cor is a permutation of orig, so transpositions are everywhere
+        rng = random.Random(3)
+        for _ in range(100):
+            o_words = random_words(rng, rng.randint(2, 12))
+            c_words = o_words[:]
+            rng.shuffle(c_words)
+            self.check_pair(o_words, c_words)
+
+    def test_document(self):
+        # The document alignment is approximate, but always covers every
+        # token in order and usually agrees with the reference
+        rng = random.Random(5)
+        same = 0
+        for _ in range(200):
+            o_words = random_words(rng, rng.randint(20, 50))
+            orig = self.make_doc(o_words)
+            cor = self.make_doc(random_edit(rng, o_words))
+            seq = Alignment(orig, cor, False, "document").align_seq
+            i = j = 0
+            for op, o_start, o_end, c_start, c_end in seq:
+                self.assertEqual((o_start, c_start), (i, j))
+                if op == "M": self.assertEqual(orig[o_start].orth, cor[c_start].orth)
+                i, j = o_end, c_end
+            self.assertEqual((i, j), (len(orig), len(cor)))
+            same += seq == reference_align(orig, cor, False)[2]
+        self.assertGreaterEqual(same, 185)
+
+    def test_editops(self):
+        # The editops alignment has the cost of the reference Levenshtein
+        # alignment and covers every token in order
+        rng = random.Random(6)
+        for _ in range(200):
+            o_words = random_words(rng, rng.randint(0, 30))
+            orig = self.make_doc(o_words)
+            cor = self.make_doc(random_edit(rng, o_words))
+            seq = Alignment(orig, cor, False, "editops").align_seq
+            i = j = 0
+            for op, o_start, o_end, c_start, c_end in seq:
+                self.assertEqual((o_start, c_start), (i, j))
+                if op == "M": self.assertEqual(orig[o_start].orth, cor[c_start].orth)
+                else: self.assertIn(op, {"S", "I", "D"})
+                i, j = o_end, c_end
+            self.assertEqual((i, j), (len(orig), len(cor)))
+            self.assertEqual(sum(op[0] != "M" for op in seq),
+                reference_align(orig, cor, True)[0][-1][-1])
+
+    def test_banded_full(self):
+        # Dense edits make the banded engine fill the full matrices
+        rng = random.Random(4)
+        Alignment._band_max_fraction = self.band_max_fraction
+        try:
+            for _ in range(20):
+                orig = self.make_doc(random_words(rng, 30))
+                cor = self.make_doc(random_words(rng, 30))
+                alignment = Alignment(orig, cor, False, "banded")
+                self.assertIsNone(alignment._band)
+                self.assertEqual(alignment.align_seq,
+                    reference_align(orig, cor, False)[2])
+        finally:
+            Alignment._band_max_fraction = 0
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+import unittest
+import warnings
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+import errant
+from errant.alignment import Alignment
+from errant.annotator import Annotator
+
+# The PTB tag, POS tag and lemma of each test word; other words are nouns
+TAGS = {"he": ("PRP", "PRON", "he"), "go": ("VB", "VERB", "go"),
+    "goes": ("VBZ", "VERB", "go"), "went": ("VBD", "VERB", "go"),
+    "to": ("IN", "ADP", "to"), "school": ("NN", "NOUN", "school"),
+    ".": (".", "PUNCT", ".")}
+# The number of Docs that errant_test_lazy_parser has parsed
+parsed = 0
+
+@Language.component("errant_test_lazy_tagger",
+    assigns=["token.tag", "token.pos", "token.lemma"])
+def tag(doc):
+    for tok in doc:
+        tok.tag_, tok.pos_, tok.lemma_ = TAGS.get(tok.lower_,
+            ("NN", "NOUN", tok.lower_))
+    return doc
+
+# Attach every token to the first verb, or else the first token
+@Language.component("errant_test_lazy_parser", assigns=["token.dep", "token.head"])
+def parse(doc):
+    global parsed
+    parsed += 1
+    root = ([tok for tok in doc if tok.pos_ == "VERB"]+[doc[0]])[0]
+    for tok in doc:
+        tok.head = root
+        tok.dep_ = "ROOT" if tok == root else "dep"
+    return doc
+
+class TestLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.annotator = Annotator("en", spacy.blank("en"))
+        vocab = self.annotator.nlp.vocab
+        words = "the cat sat on the mat and the dog ran to the big house".split()
+        self.orig = Doc(vocab, words=words, lemmas=words, pos=["DET"]*len(words))
+        words = "a dog sits at the mat and the cats run to a bigger house".split()
+        self.cor = Doc(vocab, words=words, lemmas=words, pos=["DET"]*len(words))
+
+    # Output: The alignment of align_with_limits and the warnings it raised
+    def align(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            alignment = self.annotator.align_with_limits(self.orig, self.cor)
+        return alignment, [str(warning.message) for warning in caught]
+
+    # Check that the alignment is the Levenshtein fallback
+    def check_fallback(self, limit):
+        alignment, caught = self.align()
+        self.assertEqual(self.annotator.fallbacks, 1)
+        self.assertEqual(len(caught), 1)
+        self.assertIn(limit, caught[0])
+        self.assertTrue(alignment.lev)
+        self.assertEqual(alignment.align_seq,
+            Alignment(self.orig, self.cor, True, "editops").align_seq)
+
+    def test_no_limits(self):
+        self.annotator.set_limits(max_tokens=14, max_cells=14*14, max_seconds=60)
+        alignment, caught = self.align()
+        self.assertEqual((self.annotator.fallbacks, caught), (0, []))
+        self.assertEqual(alignment.align_seq,
+            Alignment(self.orig, self.cor).align_seq)
+
+    def test_max_tokens(self):
+        self.annotator.set_limits(max_tokens=13)
+        self.check_fallback("13 tokens")
+
+    def test_max_cells(self):
+        self.annotator.set_limits(max_cells=14*14-1)
+        self.check_fallback("195 cells")
+
+    def test_max_seconds(self):
+        # The deadline has already passed when the first row is filled
+        self.annotator.set_limits(max_seconds=0)
+        self.check_fallback("0 seconds")
+
+class TestLazyDeps(unittest.TestCase):
+
+    def setUp(self):
+        nlp = spacy.blank("en")
+        nlp.add_pipe("errant_test_lazy_tagger")
+        nlp.add_pipe("errant_test_lazy_parser")
+        self.annotator = errant.load("en", nlp)
+
+    # Output: The edits of a verb form error
+    def annotate(self):
+        orig = self.annotator.parse("He go to school .")
+        cor = self.annotator.parse("He goes to school .")
+        return [edit.to_m2() for edit in self.annotator.annotate(orig, cor)]
+
+    def test_same_edits(self):
+        eager = self.annotate()
+        self.annotator.set_lazy_deps()
+        self.assertEqual(self.annotator.lazy_deps, ["errant_test_lazy_parser"])
+        count = parsed
+        self.assertEqual(self.annotate(), eager)
+        # Both Docs were dependency parsed on demand
+        self.assertEqual(parsed, count+2)
+
+    def test_other_annotator(self):
+        # Loading another pipeline without the parser must not affect the
+        # Docs of this annotator
+        self.annotator.set_lazy_deps()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            errant.load("en", spacy.blank("en"))
+        count = parsed
+        self.annotate()
+        self.assertEqual(parsed, count+2)
+
+class TestClassifierHooks(unittest.TestCase):
+
+    def test_classify_only(self):
+        # A classifier with only classify, e.g. for another language
+        def classify(edit):
+            edit.type = "R:X"
+            return edit
+        annotator = Annotator("xx", spacy.blank("en"),
+            SimpleNamespace(), SimpleNamespace(classify=classify))
+        vocab = annotator.nlp.vocab
+        orig = Doc(vocab, words=["a", "cat"], lemmas=["a", "cat"], pos=["DET", "NOUN"])
+        cor = Doc(vocab, words=["the", "cat"], lemmas=["the", "cat"], pos=["DET", "NOUN"])
+        edits = annotator.annotate(orig, cor, merging="all-split")
+        self.assertEqual([(edit.o_str, edit.c_str, edit.type) for edit in edits],
+            [("a", "the", "R:X")])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            annotator.set_classify_cache()
+        self.assertEqual(len(caught), 1)
+        self.assertIsNone(annotator.classify_cache_info())
+
+    def test_cache_per_annotator(self):
+        nlp = spacy.blank("en")
+        nlp.add_pipe("errant_test_lazy_tagger")
+        nlp.add_pipe("errant_test_lazy_parser")
+        cached, uncached = errant.load("en", nlp), errant.load("en", nlp)
+        cached.set_classify_cache()
+        # Output: The edits of a verb form error
+        def annotate(annotator):
+            orig = annotator.parse("He go to school .")
+            cor = annotator.parse("He goes to school .")
+            return [edit.to_m2() for edit in annotator.annotate(orig, cor)]
+        expected = annotate(uncached)
+        self.assertEqual(annotate(cached), expected)
+        self.assertEqual(annotate(cached), expected)
+        info = cached.classify_cache_info()
+        self.assertEqual((info["hits"], info["misses"]), (1, 1))
+        # The other annotator still has no cache
+        self.assertIsNone(uncached.classify_cache_info())
+        self.assertEqual(annotate(uncached), expected)
+        self.assertEqual(cached.classify_cache_info()["hits"], 1)
+        cached.set_classify_cache(None)
+        self.assertIsNone(cached.classify_cache_info())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import os
+import tempfile
+import unittest
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+import errant
+from errant.annotator import Annotator
+from errant.cache import ParseCache, ResultCache
+from errant.en import classifier, merger
+
+# Tag every token so that the cached Docs have annotations to compare
+@Language.component("errant_test_tagger", assigns=["token.tag", "token.pos", "token.lemma"])
+def tag(doc):
+    for tok in doc:
+        tok.tag_ = "NN" if tok.is_alpha else "."
+        tok.pos_ = "NOUN" if tok.is_alpha else "PUNCT"
+        tok.lemma_ = tok.lower_
+    return doc
+
+# Attach every token to the first token
+@Language.component("errant_test_parser", assigns=["token.dep", "token.head"])
+def parse(doc):
+    for tok in doc[1:]:
+        tok.head = doc[0]
+        tok.dep_ = "dep"
+    if len(doc): doc[0].dep_ = "ROOT"
+    return doc
+
+# Output: A spacy pipeline with the test components
+def make_nlp():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("errant_test_tagger")
+    nlp.add_pipe("errant_test_parser")
+    return nlp
+
+# Input: A spacy Doc
+# Output: The text and annotations of each token
+def get_annotations(doc):
+    return [(tok.text, tok.tag_, tok.pos_, tok.lemma_, tok.dep_, tok.head.i)
+        for tok in doc]
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.nlp = make_nlp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # Input: A text string
+    # Output: The text parsed by the test pipeline
+    def parse(self, text):
+        return self.nlp(Doc(self.nlp.vocab, text.split()))
+
+    # Output: The number of Docs stored on disk
+    def count_files(self):
+        return sum(len(files) for _, _, files in os.walk(self.path))
+
+    def test_memory_hit(self):
+        annotator = Annotator("en", self.nlp)
+        annotator.set_parse_cache()
+        doc = annotator.parse("The cat sat on the mat .")
+        cached = annotator.parse("The cat sat on the mat .")
+        self.assertEqual(get_annotations(cached), get_annotations(doc))
+        info = annotator.parse_cache.info()
+        self.assertEqual((info["hits"], info["misses"]), (1, 1))
+        # Batches share the cache
+        docs = list(annotator.parse_batch(["The cat sat on the mat .", "A dog ."]))
+        self.assertEqual(get_annotations(docs[0]), get_annotations(doc))
+        self.assertEqual(get_annotations(docs[1]),
+            get_annotations(self.parse("A dog .")))
+        self.assertEqual(annotator.parse_cache.info()["hits"], 2)
+
+    def test_disk_round_trip(self):
+        cache = ParseCache(self.nlp, path=self.path)
+        key = cache.get_key("The cat sat .", False)
+        doc = self.parse("The cat sat .")
+        cache.put(key, doc)
+        self.assertEqual(self.count_files(), 1)
+        # A new cache, e.g. in the next run, reads the Doc from disk
+        cache = ParseCache(self.nlp, path=self.path)
+        cached = cache.get(key)
+        self.assertEqual(get_annotations(cached), get_annotations(doc))
+        self.assertEqual(cache.info()["disk_hits"], 1)
+        # The Doc is now in memory too
+        self.assertIs(cache.get(key), cached)
+        self.assertEqual(cache.info()["hits"], 1)
+
+    def test_lazy_deps_not_persisted(self):
+        annotator = Annotator("en", self.nlp)
+        annotator.set_parse_cache(path=self.path)
+        annotator.set_lazy_deps()
+        doc = annotator.parse("The cat sat .")
+        self.assertIn("lazy_deps", doc.user_data)
+        self.assertEqual(self.count_files(), 0)
+        # The Doc is still cached in memory
+        self.assertIs(annotator.parse("The cat sat ."), doc)
+        # Fully parsed Docs are stored on disk
+        annotator.set_lazy_deps(False)
+        annotator.parse("The cat sat .")
+        self.assertEqual(self.count_files(), 1)
+
+    def test_keys(self):
+        cache = ParseCache(self.nlp)
+        key = cache.get_key("The cat sat .", False)
+        self.assertEqual(cache.get_key("The cat sat .", False), key)
+        self.assertNotEqual(cache.get_key("The cat sat", False), key)
+        self.assertNotEqual(cache.get_key("The cat sat .", True), key)
+        self.assertNotEqual(cache.get_key("The cat sat .", False, True), key)
+        # Disabling a component changes the pipeline
+        with self.nlp.select_pipes(disable=["errant_test_parser"]):
+            self.assertNotEqual(cache.get_key("The cat sat .", False), key)
+        self.assertEqual(cache.get_key("The cat sat .", False), key)
+
+    def test_eviction(self):
+        cache = ParseCache(self.nlp, maxsize=2)
+        docs = {text: self.parse(text) for text in ["a", "b", "c"]}
+        cache.put("a", docs["a"])
+        cache.put("b", docs["b"])
+        # Using a makes b the least recently used Doc
+        self.assertIs(cache.get("a"), docs["a"])
+        cache.put("c", docs["c"])
+        self.assertEqual(cache.info()["size"], 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("a"), docs["a"])
+        self.assertIs(cache.get("c"), docs["c"])
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.nlp = make_nlp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "results.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        cache = ResultCache(self.path, self.nlp)
+        key = cache.get_key("The cat sit .", "The cat sat .")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, [["The", "cat", "sit", "."], [], False])
+        self.assertEqual(cache.get(key), [["The", "cat", "sit", "."], [], False])
+        cache.close()
+        # The results persist across runs
+        cache = ResultCache(self.path, self.nlp)
+        self.assertEqual(cache.get(key), [["The", "cat", "sit", "."], [], False])
+        self.assertEqual(cache.info()["size"], 1)
+        cache.close()
+
+    def test_annotate_text(self):
+        annotator = Annotator("en", self.nlp, merger, classifier)
+        annotator.set_result_cache(self.path)
+        result = annotator.annotate_text("The cat sit on mat .",
+            "The cats sat on the mat .")
+        self.assertEqual(annotator.annotate_text("The cat sit on mat .",
+            "The cats sat on the mat ."), result)
+        # Different options are different results
+        annotator.annotate_text("The cat sit on mat .",
+            "The cats sat on the mat .", merging="all-split")
+        info = annotator.result_cache.info()
+        self.assertEqual((info["hits"], info["misses"], info["size"]), (1, 2, 2))
+        annotator.result_cache.close()
+
+    def test_keys(self):
+        cache = ResultCache(self.path, self.nlp)
+        key = cache.get_key("The cat sit .", "The cat sat .")
+        self.assertEqual(cache.get_key("The cat sit .", "The cat sat ."), key)
+        self.assertNotEqual(cache.get_key("The cat sit .", "The cat sat"), key)
+        # Other ERRANT versions may give other results
+        version = errant.__version__
+        errant.__version__ = version+".test"
+        try:
+            self.assertNotEqual(cache.get_key("The cat sit .", "The cat sat ."), key)
+        finally:
+            errant.__version__ = version
+        # So may other spacy pipelines
+        with self.nlp.select_pipes(disable=["errant_test_parser"]):
+            self.assertNotEqual(cache.get_key("The cat sit .", "The cat sat ."), key)
+        self.assertNotEqual(ResultCache(self.path, spacy.blank("en")).get_key(
+            "The cat sit .", "The cat sat ."), key)
+        cache.close()
+
+    def test_eviction(self):
+        # Evict after every new result
+        cache = ResultCache(self.path, self.nlp, max_entries=3)
+        for n in range(3): cache.put(str(n), n)
+        # Using 0 makes 1 the least recently used result
+        self.assertEqual(cache.get("0"), 0)
+        cache.put("3", 3)
+        self.assertEqual(cache.info()["size"], 3)
+        self.assertIsNone(cache.get("1"))
+        self.assertEqual([cache.get(key) for key in "023"], [0, 2, 3])
+        cache.close()
+        # Extra results are evicted when a cache is opened with a lower limit
+        cache = ResultCache(self.path, self.nlp, max_entries=1)
+        self.assertEqual(cache.info()["size"], 1)
+        self.assertEqual(cache.get("3"), 3)
+        cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+import unittest
+
+# The root of the repository, which is on the path of the new interpreters
+root = Path(__file__).resolve().parent.parent
+
+# Input: Python code that prints a JSON result
+# Output: The result of running the code in a new interpreter
+def run(code):
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+        capture_output=True, text=True, cwd=root).stdout
+    return json.loads(output)
+
+# Import a module in a new interpreter and report which of the slow modules
+# it loaded
+IMPORT_CODE = """
+import json, sys
+import {module}
+print(json.dumps(sorted(name for name in sys.modules
+    if name.split(".")[0] in {{"spacy", "rapidfuzz", "numpy"}} or
+    name in {{"errant.annotator", "errant.en.classifier"}})))
+"""
+
+# Import the classifier in a new interpreter and report whether its resources
+# are loaded before and after the word list is first used
+CLASSIFIER_CODE = """
+import json
+from errant.en import classifier
+before = [classifier.resources_loaded, "spell" in vars(classifier)]
+known = "colour" in classifier.spell
+after = [classifier.resources_loaded, "spell" in vars(classifier)]
+print(json.dumps([before, known, after]))
+"""
+
+class TestImports(unittest.TestCase):
+
+    def test_errant(self):
+        # errant.load imports spacy and the classifier when it is called
+        self.assertEqual(run(IMPORT_CODE.format(module="errant")), [])
+
+    def test_compare_m2(self):
+        # errant_compare does not need spacy at all
+        self.assertEqual(
+            run(IMPORT_CODE.format(module="errant.commands.compare_m2")), [])
+
+    def test_classifier(self):
+        # The classifier needs spacy, but only loads the stemmer, word list
+        # and pos map when they are first used
+        before, known, after = run(CLASSIFIER_CODE)
+        self.assertEqual(before, [False, False])
+        self.assertTrue(known)
+        self.assertEqual(after, [True, True])
+
+if __name__ == "__main__":
+    unittest.main()
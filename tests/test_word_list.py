@@ -0,0 +1,58 @@
+import os
+import random
+import tempfile
+import unittest
+from errant.en.classifier import WordList, base_dir
+
+class TestWordList(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(base_dir/"resources"/"en_GB-large.txt", "rb") as word_list:
+            cls.data = word_list.read()
+        cls.words = cls.data.decode("utf8").split()
+        # Words and near misses: case changes, prefixes and extensions
+        rng = random.Random(0)
+        sample = [rng.choice(cls.words) for _ in range(5000)]
+        cls.queries = sample + [word.upper() for word in sample] + \
+            [word[:-1] for word in sample] + [word+"s" for word in sample] + \
+            ["", " ", "\r", "a\nb", "Zzz", cls.words[0], cls.words[-1],
+            cls.words[-1]+"a", "naïve"]
+
+    # Input 1: The bytes of a word list file
+    # Input 2: The number of bytes per block
+    # Check that the WordList of the file gives the same results as a set
+    def check_file(self, data, block_size=256):
+        words = set(data.decode("utf8").split())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "words.txt")
+            with open(path, "wb") as word_list:
+                word_list.write(data)
+            word_list = WordList(path, block_size)
+            for word in self.queries:
+                self.assertEqual(word in word_list, word in words, repr(word))
+            word_list.data.close()
+
+    def test_bundled(self):
+        word_list = WordList(base_dir/"resources"/"en_GB-large.txt")
+        words = set(self.words)
+        for word in self.words+self.queries:
+            self.assertEqual(word in word_list, word in words, repr(word))
+
+    def test_block_sizes(self):
+        for block_size in (16, 5000, 100000):
+            self.check_file(self.data, block_size)
+
+    def test_line_breaks(self):
+        lf = self.data.replace(b"\r\n", b"\n")
+        self.check_file(lf)
+        # No line break after the last word
+        self.check_file(lf.rstrip(b"\n"))
+        self.check_file(self.data.rstrip(b"\r\n"))
+
+    def test_small(self):
+        self.check_file(b"cat")
+        self.check_file(b"cat\ndog\n")
+
+if __name__ == "__main__":
+    unittest.main()